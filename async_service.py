@@ -0,0 +1,158 @@
+"""
+Асинхронный фасад над EllipticCurve и EllipticCurvePoint для сервисов на asyncio.
+Одновременные запросы собираются в микропакеты по кривой и виду операции и выполняются в ограниченном
+исполнителе, поэтому цикл событий не блокируется, а пакет использует общие для запросов оптимизации:
+таблицу фиксированной базы для повторяющейся точки и единственный подсчет порядка кривой
+"""
+import asyncio
+import collections
+import concurrent.futures
+import secrets
+
+import gmpy2
+
+from elliptic_curve import EllipticCurve, EllipticCurvePoint
+
+
+def _run_mul(curve: EllipticCurve, items: list) -> list:
+    """
+    Пакет умножений (point, scalar): точка, встретившаяся несколько раз, умножается по таблице фиксированной базы
+    """
+    counts = collections.Counter((P.x, P.y, P.is_inf) for P, _ in items)
+    for P, _ in items:
+        if counts.pop((P.x, P.y, P.is_inf), 0) >= 4:  # Таблица окупается уже на нескольких умножениях
+            P.precompute()
+    return [P * k for P, k in items]  # При наличии таблицы умножение идет по ней
+
+
+def _run_generate(curve: EllipticCurve, items: list) -> list:
+    state = gmpy2.random_state(secrets.randbits(64))  # Свое зерно у каждого пакета, как в generate_points
+    return [curve.generate_point(state) for _ in items]
+
+
+def _run_order(curve: EllipticCurve, items: list) -> list:
+    order = curve.calculate_order()  # Один подсчет на пакет, дальше порядок хранится в кривой
+    return [order] * len(items)
+
+
+_OPERATIONS = {'mul': _run_mul, 'generate': _run_generate, 'order': _run_order}
+
+
+def _run_batch(kind: str, curve: EllipticCurve, items: list) -> list:
+    """
+    Выполнение пакета в исполнителе: при ошибке пакета каждый запрос повторяется отдельно,
+    чтобы ошибка досталась только своему запросу. Элементы результата - (значение, исключение)
+    """
+    function = _OPERATIONS[kind]
+    try:
+        return [(value, None) for value in function(curve, items)]
+    except Exception:
+        results = []
+        for item in items:
+            try:
+                results.append((function(curve, [item])[0], None))
+            except Exception as error:
+                results.append((None, error))
+        return results
+
+
+class CurveService:
+    """
+    Запросы k * P, случайных точек и порядка кривой в виде корутин. Запросы одной кривой и вида,
+    пришедшие в течение batch_delay секунд, выполняются одним пакетом размером не больше max_batch.
+    Не больше max_pending запросов ожидают выполнения: следующий запрос ждет освобождения места.
+    Отмена ожидающей корутины убирает ее запрос из еще не запущенного пакета.
+    По умолчанию пакеты выполняются в одном потоке: арифметика gmpy2 держит GIL, и дополнительные потоки
+    не ускорили бы ее, а кэши кривых и таблиц остаются однопоточными
+
+        async with CurveService() as service:
+            Q = await service.mul(P, k)
+    """
+    def __init__(self, max_batch: int = 64, batch_delay: float = 0.001, max_pending: int = 1024,
+                 executor: concurrent.futures.Executor = None):
+        assert max_batch >= 1 and batch_delay >= 0 and max_pending >= 1
+        self.max_batch = max_batch
+        self.batch_delay = batch_delay
+        self._slots = asyncio.Semaphore(max_pending)
+        self._own_executor = executor is None
+        self._executor = executor or concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._pending = {}  # (вид, кривая) -> [(аргумент, future)]
+        self._timers = {}
+        self._running = set()
+        self._closed = False
+
+    async def __aenter__(self) -> 'CurveService':
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+    async def mul(self, point: EllipticCurvePoint, scalar: gmpy2.mpz) -> EllipticCurvePoint:
+        return await self._submit('mul', point.curve, (point, gmpy2.mpz(scalar)))
+
+    async def generate_point(self, curve: EllipticCurve) -> EllipticCurvePoint:
+        return await self._submit('generate', curve, None)
+
+    async def order(self, curve: EllipticCurve) -> gmpy2.mpz:
+        return await self._submit('order', curve, None)
+
+    async def _submit(self, kind: str, curve: EllipticCurve, item):
+        assert not self._closed
+        await self._slots.acquire()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        future.add_done_callback(lambda _: self._slots.release())
+        key = (kind, curve)
+        batch = self._pending.setdefault(key, [])
+        batch.append((item, future))
+        if len(batch) >= self.max_batch:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self.batch_delay, self._flush, key)
+        return await future
+
+    def _flush(self, key: tuple):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = [(item, future) for item, future in self._pending.pop(key, []) if not future.done()]
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._execute(key, batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _execute(self, key: tuple, batch: list):
+        kind, curve = key
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self._executor, _run_batch, kind, curve,
+                                                 [item for item, _ in batch])
+        except asyncio.CancelledError:
+            for _, future in batch:
+                future.cancel()
+            raise
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, future), (value, error) in zip(batch, results):
+            if future.done():  # Запрос отменен, пока пакет выполнялся
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(value)
+
+    async def aclose(self):
+        """
+        Запуск накопленных пакетов, ожидание выполняющихся и остановка собственного исполнителя
+        """
+        self._closed = True
+        for key in list(self._pending):
+            self._flush(key)
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+        if self._own_executor:
+            self._executor.shutdown(wait=True)
@@ -0,0 +1,162 @@
+"""
+Замеры скорости арифметики кривых, подсчета порядка и квадратных корней.
+Для каждой операции и размера p записываются операции в секунду, перцентили задержки и выделения памяти
+(пиковый объем и число оставшихся блоков по tracemalloc). Результаты пишутся в JSON и могут сравниваться
+с сохраненным базовым файлом: сценарий завершается с кодом 1, если операция стала медленнее порога.
+
+    python benchmark.py --output current.json
+    python benchmark.py --baseline baseline.json --threshold 0.2
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import gmpy2
+
+from elliptic_curve import EllipticCurve, get_sqrt
+
+BITS = (8, 16, 32, 64, 128, 256, 512, 1024)
+ORDER_BITS = (8, 16, 32, 48)  # Подсчет порядка при больших p занимает секунды и минуты на один вызов
+PERCENTILES = (50, 90, 99)
+
+
+def make_curve(bits: int) -> EllipticCurve:
+    """
+    Детерминированная кривая y^2 = x^3 + 3x + 7 над наименьшим простым больше 2^(bits - 1)
+    """
+    p = gmpy2.next_prime(gmpy2.mpz(2) ** (bits - 1))
+    a, b = gmpy2.mpz(3), gmpy2.mpz(7)
+    while gmpy2.mod(4 * a ** 3 + 27 * b ** 2, p) == 0:
+        b += 1
+    return EllipticCurve(a=a, b=b, p=p)
+
+
+def operations(bits: int, state) -> dict:
+    """
+    Имя операции -> функция без аргументов, выполняющая одну операцию над кривой размера bits
+    """
+    curve = make_curve(bits)
+    P, Q = curve.generate_point(state), curve.generate_point(state)
+    k = gmpy2.mpz_urandomb(state, bits) | 1
+    t = gmpy2.mod(P.y * P.y, curve.p)
+    return {
+        'add': lambda: P + Q,
+        'double': lambda: P + P,
+        'double_and_add': lambda: P.double_and_add(k),
+        'ternary_mul': lambda: P.ternary_mul(k),
+        'get_sqrt': lambda: get_sqrt(t, curve.p),
+        'generate_point': lambda: curve.generate_point(state),
+        'calculate_order': curve._calculate_order,  # Минуя порядок, сохраненный в кривой
+    }
+
+
+def measure(function, min_time: float, min_repeats: int, max_repeats: int) -> dict:
+    """
+    Задержки отдельных вызовов, пока их сумма не превысит min_time, и отдельный вызов под tracemalloc
+    """
+    function()  # Прогрев кэшей
+    latencies = []
+    total = 0.0
+    while len(latencies) < max_repeats and (len(latencies) < min_repeats or total < min_time):
+        start = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - start)
+        total += latencies[-1]
+    latencies.sort()
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        result = function()
+        peak = tracemalloc.get_traced_memory()[1]
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    del result
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+
+    return {
+        'repeats': len(latencies),
+        'ops_per_sec': len(latencies) / total if total else float('inf'),
+        'latency': {f'p{q}': latencies[min(len(latencies) - 1, len(latencies) * q // 100)] for q in PERCENTILES},
+        'alloc_peak_bytes': peak,
+        'alloc_blocks': blocks,
+    }
+
+
+def run(bits=BITS, order_bits=ORDER_BITS, names=None, min_time: float = 0.2, min_repeats: int = 5,
+        max_repeats: int = 100000, seed: int = 0) -> dict:
+    """
+    Замеры всех операций для всех размеров; ключи результатов - "операция/биты"
+    """
+    state = gmpy2.random_state(seed)
+    results = {}
+    for size in sorted(set(bits) | set(order_bits)):
+        for name, function in operations(size, state).items():
+            if names and name not in names:
+                continue
+            if size not in (order_bits if name == 'calculate_order' else bits):
+                continue
+            repeats = (1, 1) if name == 'calculate_order' and size > 32 else (min_repeats, max_repeats)
+            results[f'{name}/{size}'] = measure(function, min_time, *repeats)
+    return {
+        'python': platform.python_version(),
+        'gmpy2': gmpy2.version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """
+    Регрессии: операции, у которых число операций в секунду упало больше чем на долю threshold от базового
+    """
+    regressions = []
+    for key, base in baseline['results'].items():
+        result = current['results'].get(key)
+        if result is None:
+            continue
+        ratio = result['ops_per_sec'] / base['ops_per_sec']
+        if ratio < 1 - threshold:
+            regressions.append((key, base['ops_per_sec'], result['ops_per_sec'], ratio))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--bits', type=int, nargs='+', default=BITS)
+    parser.add_argument('--order-bits', type=int, nargs='+', default=ORDER_BITS)
+    parser.add_argument('--ops', nargs='+', help='только указанные операции')
+    parser.add_argument('--min-time', type=float, default=0.2, help='секунд замеров на операцию')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    parser.add_argument('--baseline', help='файл JSON с базовыми результатами')
+    parser.add_argument('--threshold', type=float, default=0.2, help='допустимое замедление, доля от базового')
+    args = parser.parse_args(argv)
+
+    current = run(args.bits, args.order_bits, args.ops, args.min_time, seed=args.seed)
+    for key, result in current['results'].items():
+        latency = ' '.join(f"{q}={value * 1e6:.1f}us" for q, value in result['latency'].items())
+        print(f"{key:24} {result['ops_per_sec']:14.1f} ops/s  {latency}  "
+              f"peak={result['alloc_peak_bytes']}B blocks={result['alloc_blocks']}")
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(current, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(current, baseline, args.threshold)
+        for key, base, value, ratio in regressions:
+            print(f"REGRESSION {key}: {base:.1f} -> {value:.1f} ops/s ({ratio:.0%})", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,26 +1,183 @@
+import collections
+import concurrent.futures
+import functools
 import gmpy2
+import itertools
 import math
+import mmap
+import os
+import secrets
+import struct
+import sys
+import time
+
+import small_field
+from schoof import schoof_order
+
+
+# Активный учет операций (Instrumentation), None - учет выключен и стоит одной проверки в каждой операции
+_instrumentation = None
+
+
+class Instrumentation:
+    """
+    Контекстный менеджер учета операций: число обращений и умножений в поле, сложений и удвоений точек,
+    проверок при создании точек и кривых, а также время и счетчики вызовов публичных методов
+    по месту вызова. Учет глобальный для процесса, вложенные менеджеры восстанавливают внешний при выходе,
+    работа в процессах пула (map_mul, generate_points) не учитывается. Умножения считаются по формулам,
+    без умножений на малые константы; арифметика многочленов в алгоритме Шуфа не считается
+
+        with Instrumentation() as stats:
+            P.ternary_mul(k)
+        stats.report()
+    """
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.sites = {}
+        self._previous = None
+
+    def __enter__(self) -> 'Instrumentation':
+        global _instrumentation
+        self._previous = _instrumentation
+        _instrumentation = self
+        return self
+
+    def __exit__(self, *args):
+        global _instrumentation
+        _instrumentation = self._previous
+        self._previous = None
+
+    def record(self, **counts):
+        self.counts.update(counts)
+
+    def _call(self, method, frame, args, kwargs):
+        site = (method.__qualname__, frame.f_code.co_filename, frame.f_lineno)
+        before = self.counts.copy()
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            entry = self.sites.get(site)
+            if entry is None:
+                entry = self.sites[site] = {'calls': 0, 'seconds': 0.0, 'counts': collections.Counter()}
+            entry['calls'] += 1
+            entry['seconds'] += elapsed
+            entry['counts'].update(self.counts - before)
+
+    def report(self) -> dict:
+        """
+        Итоговые счетчики и места вызова по убыванию суммарного времени; счетчики места включают вложенные вызовы
+        """
+        sites = [
+            {'method': method, 'file': file, 'line': line, 'calls': entry['calls'], 'seconds': entry['seconds'],
+             'counts': dict(entry['counts'])}
+            for (method, file, line), entry in self.sites.items()
+        ]
+        sites.sort(key=lambda site: site['seconds'], reverse=True)
+        return {'counts': dict(self.counts), 'sites': sites}
+
+
+def _instrumented(method):
+    """
+    Учет времени и операций метода по месту вызова, если активен Instrumentation
+    """
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        if _instrumentation is None:
+            return method(*args, **kwargs)
+        return _instrumentation._call(method, sys._getframe(1), args, kwargs)
+    return wrapper
+
+
+# Порядок кривых над p длиннее этого числа бит считается алгоритмом Шуфа: по замерам BSGS замедляется вдвое
+# на каждые 4 бита, а время Шуфа растет медленно, и они сравниваются около 76 бит (~9 с)
+_SCHOOF_MIN_BITS = 76
+
+# (a, b, p) -> EllipticCurve: кривые интернируются, вытесняются по LRU
+_CURVE_CACHE_SIZE = 256
+_curves = collections.OrderedDict()
 
 
 class EllipticCurve:
-    def __init__(
-            self,
+    def __new__(
+            cls,
             a: gmpy2.mpz,
             b: gmpy2.mpz,
             p: gmpy2.mpz
     ):
+        """
+        Кривая с теми же (a, b, p) возвращается из кэша вместе с уже вычисленными для нее константами,
+        поэтому точки одной кривой обычно ссылаются на один объект и сравнение кривых сводится к is
+        """
         assert a.bit_count() < 1024 and b.bit_count() < 1024 and p.bit_count() < 1024
-        assert (gmpy2.mod(4 * gmpy2.powmod(a, 3, p), p) +
-                gmpy2.mod(27 * gmpy2.powmod(b, 2, p), p) != 0)  # Сингулярная кривая 4a^3 + 27B^2 == 0
         assert p > 3
-        self.a = gmpy2.mod(a, p)
-        self.b = gmpy2.mod(b, p)
-        self.p = p
+        key = (gmpy2.mod(a, p), gmpy2.mod(b, p), p)
+        curve = _curves.get(key)
+        if curve is None:
+            assert (gmpy2.mod(4 * gmpy2.powmod(a, 3, p), p) +
+                    gmpy2.mod(27 * gmpy2.powmod(b, 2, p), p) != 0)  # Сингулярная кривая 4a^3 + 27B^2 == 0
+            if _instrumentation is not None:
+                _instrumentation.record(validations=1)
+            curve = super().__new__(cls)
+            curve.a, curve.b, curve.p = key
+            curve._order = None
+            curve._log_tables = collections.OrderedDict()  # Таблицы baby steps для discrete_log
+            _curves[key] = curve
+            while len(_curves) > _CURVE_CACHE_SIZE:
+                _curves.popitem(last=False)
+        _curves.move_to_end(key)
+        return curve
+
+    def __reduce__(self):
+        return EllipticCurve, (self.a, self.b, self.p)
 
     def __eq__(self, other):
+        if self is other:
+            return True
         return self.a == other.a and self.b == other.b and self.p == other.p
 
+    def __hash__(self):
+        return hash((self.a, self.b, self.p))
+
+    @functools.cached_property
+    def _sqrt_params(self) -> tuple:
+        return _tonelli_shanks_params(self.p)
+
+    @functools.cached_property
+    def _non_residue(self) -> gmpy2.mpz:
+        return _non_residue(self.p)
+
+    @functools.cached_property
+    def _bsgs_width(self) -> int:
+        return math.ceil(math.pow(self.p, 1 / 4) * math.sqrt(2))  # Параметр giant step
+
+    @functools.cached_property
+    def _twist(self) -> 'EllipticCurve':
+        """
+        Квадратичное кручение g^2 * a, g^3 * b для квадратичного невычета g
+        """
+        g = self._non_residue
+        c = gmpy2.mod(gmpy2.mul(gmpy2.powmod(g, 2, self.p), self.a), self.p)
+        d = gmpy2.mod(gmpy2.mul(gmpy2.powmod(g, 3, self.p), self.b), self.p)
+        return EllipticCurve(c, d, self.p)
+
+    @functools.cached_property
+    def _order_factors(self) -> dict:
+        return _factorize(self.calculate_order())
+
+    @_instrumented
     def calculate_order(self):
+        """
+        Порядок группы точек, вычисляется один раз для кривой
+        """
+        if self._order is None:
+            self._order = gmpy2.mpz(self._calculate_order())
+        return self._order
+
+    def _calculate_order(self):
+        if small_field.AVAILABLE and self.p < 1 << 14:  # Векторный подсчет по всем x быстрее BSGS до p ~ 2^14
+            return gmpy2.mpz(small_field.SmallFieldCurve(self.a, self.b, self.p).count_points())
         if self.p <= 229:   # Если p достаточно мал, то return p + 1 + Sum(legendre(x^3+ax+b, p))
             return self.p + 1 + gmpy2.fsum(
                 gmpy2.legendre(
@@ -28,13 +185,11 @@ class EllipticCurve:
                     self.p)
                 for x in range(0, self.p)
             )
+        if self.p.bit_length() > _SCHOOF_MIN_BITS:  # Шаги BSGS растут как p^(1/4) - алгоритм Шуфа полиномиален
+            return schoof_order(self.a, self.b, self.p)
         state = gmpy2.random_state(hash(gmpy2.random_state()))
-        g = gmpy2.mpz_random(state, self.p)  # генерируем случайный квадратичный невычет
-        while gmpy2.legendre(g, self.p) != -1:
-            g = gmpy2.mpz_random(state, self.p)
-        W = math.ceil(math.pow(self.p, 1 / 4) * math.sqrt(2))  # Параметр giant step
-        c = gmpy2.mod(gmpy2.mul(gmpy2.powmod(g, 2, self.p), self.a), self.p)  # Параметр a искаженной кривой
-        d = gmpy2.mod(gmpy2.mul(gmpy2.powmod(g, 3, self.p), self.b), self.p)  # Параметр b искаженной кривой
+        g = self._non_residue
+        W = self._bsgs_width
         while True:
             x = gmpy2.mpz_random(state, self.p)  # Выбрать случайный x
             sigma = gmpy2.legendre(
@@ -43,77 +198,523 @@ class EllipticCurve:
             if sigma == 0:  # x^3+ax+b делится на p
                 continue
             elif sigma == 1:  # x^3+ax+b - квадратичный вычет по модулю p -> Кривую не нужно искажать
-                E = EllipticCurve(self.a, self.b, self.p)
+                E = self
             else:  # x^3+ax+b - квадратичный невычет -> исказить кривую и сделать допустимый x
-                E = EllipticCurve(c, d, self.p)
+                E = self._twist
                 x = gmpy2.mod(gmpy2.mul(x, g), self.p)
-            y = get_sqrt(gmpy2.mod(gmpy2.powmod(x, 3, E.p) + gmpy2.mul(E.a, x) + E.b, E.p), E.p)
-
-            P = EllipticCurvePoint(x=x, y=y, curve=E)
+            y = get_sqrt(gmpy2.mod(gmpy2.powmod(x, 3, E.p) + gmpy2.mul(E.a, x) + E.b, E.p), E.p, E._sqrt_params)
 
-            # Рассчет пересечения двух списков
-            A = [P.ternary_mul(self.p + 1 + baby).x for baby in range(0, W)]
-            B = [P.ternary_mul(gmpy2.mul(giant, W)).x for giant in range(0, W + 1)]
-            S = list(set(A) & set(B))
-            if len(S) != 1:
-                continue
-            s = S[0]
-            baby_idx = A.index(s)
-            giant_idx = B.index(s)
-            t = baby_idx + gmpy2.mul(giant_idx, W)
+            P = EllipticCurvePoint._trusted(x=x, y=y, curve=E)
 
-            if not P.ternary_mul(self.p + 1 + t).is_inf:
-                t = baby_idx - gmpy2.mul(giant_idx, W)
+            # Baby steps (p + 1 + j) * P, j = 0..W-1: шаг - сложение с P, индекс по x-координате
+            baby_index = {}
+            R = P.ternary_mul(self.p + 1)
+            for baby in range(0, W):
+                baby_index.setdefault(R.x, baby)
+                R = R + P
 
-            return self.p + 1 + gmpy2.mul(sigma, t)
+            # Giant steps (i * W) * P, i = 0..W: шаг - сложение с W * P, сверка с индексом по мере вычисления.
+            # Совпадение по x дает кандидатов p + 1 + j +- i * W, первый проверенный кандидат - ответ
+            WP = P.ternary_mul(W)
+            R = EllipticCurvePoint._trusted(x=gmpy2.mpz(0), y=gmpy2.mpz(0), curve=E, is_inf=True)
+            for giant in range(0, W + 1):
+                baby_idx = baby_index.get(R.x)
+                if baby_idx is not None:
+                    for t in (baby_idx + gmpy2.mul(giant, W), baby_idx - gmpy2.mul(giant, W)):
+                        if P.ternary_mul(self.p + 1 + t).is_inf:
+                            break
+                    else:  # Ложное совпадение - идти дальше
+                        R = R + WP
+                        continue
+                    # Кратное порядка P в интервале Хассе единственно, только если порядок P больше 4 * sqrt(p),
+                    # иначе взять другую точку
+                    if gmpy2.square(_point_order(P, self.p + 1 + t)) <= 16 * self.p:
+                        break
+                    return self.p + 1 + gmpy2.mul(sigma, t)
+                R = R + WP
 
-    def generate_point(self):
-        state = gmpy2.random_state(hash(gmpy2.random_state()))
+    @_instrumented
+    def generate_point(self, state=None):
+        if state is None:
+            state = gmpy2.random_state(hash(gmpy2.random_state()))
         while True:
             x = gmpy2.mpz_random(state, self.p)
             t = gmpy2.mod(gmpy2.mul(x, gmpy2.powmod(x, 2, self.p) + self.a) + self.b, self.p)
             if gmpy2.jacobi(t, self.p) == -1:
                 continue
             else:
-                return EllipticCurvePoint(
+                return EllipticCurvePoint._trusted(
                     x=x,
-                    y=get_sqrt(t, self.p),
+                    y=get_sqrt(t, self.p, self._sqrt_params),
                     curve=self,
                     is_inf=False
                 )
 
 
-def get_sqrt(x: gmpy2.mpz, p: gmpy2.mpz):
+    def points(self):
+        """
+        Все точки кривой в детерминированном порядке: бесконечность, затем по возрастанию x и y
+        """
+        yield EllipticCurvePoint._trusted(x=gmpy2.mpz(0), y=gmpy2.mpz(0), curve=self, is_inf=True)
+        if small_field.AVAILABLE and self.p < 1 << 20:
+            for x, y in zip(*small_field.SmallFieldCurve(self.a, self.b, self.p).points()):
+                yield EllipticCurvePoint._trusted(x=gmpy2.mpz(int(x)), y=gmpy2.mpz(int(y)), curve=self)
+            return
+        for x in range(self.p):
+            x = gmpy2.mpz(x)
+            t = gmpy2.mod(gmpy2.mul(x, gmpy2.powmod(x, 2, self.p) + self.a) + self.b, self.p)
+            if gmpy2.jacobi(t, self.p) == -1:
+                continue
+            y = get_sqrt(t, self.p, self._sqrt_params)
+            for root in sorted({y, gmpy2.mod(-y, self.p)}):
+                yield EllipticCurvePoint._trusted(x=x, y=root, curve=self)
+
+    def map_mul(self, point: 'EllipticCurvePoint', scalars, workers: int = None, chunk_size: int = 256):
+        """
+        Поток k * point для k из scalars в исходном порядке. Работа делится на части по chunk_size скаляров
+        между workers процессами (по умолчанию - по числу ядер), точки передаются в кодировке PointBuffer
+        """
+        assert point.curve == self
+        params = PointBuffer.pack(self, [])
+        encoded = point.to_bytes(compressed=False)
+        tasks = ((params, encoded, chunk) for chunk in _chunks(scalars, chunk_size))
+        return _stream_parallel(self, _parallel_mul, tasks, workers)
+
+    def generate_points(self, count: int, workers: int = None, chunk_size: int = 256):
+        """
+        Поток из count случайных точек, сгенерированных в пуле процессов; у каждой части свое зерно
+        """
+        params = PointBuffer.pack(self, [])
+        tasks = ((params, secrets.randbits(64), len(chunk)) for chunk in _chunks(range(count), chunk_size))
+        return _stream_parallel(self, _parallel_generate, tasks, workers)
+
+    def _batch_to_affine(self, points: list) -> list:
+        """
+        Перевод точек из координат Якоби (X, Y, Z) в аффинные с одним общим обращением на весь список.
+        Результат не проверяется на принадлежность кривой - только для координат, вычисленных внутри модуля
+        """
+        points = list(points)
+        result = []
+        for (X, Y, Z), z_inv in zip(points, _batch_invert([Z for _, _, Z in points], self.p)):
+            if z_inv is None:
+                result.append(EllipticCurvePoint._trusted(x=gmpy2.mpz(0), y=gmpy2.mpz(0), curve=self, is_inf=True))
+                continue
+            if _instrumentation is not None:
+                _instrumentation.record(multiplications=4)
+            z_inv2 = gmpy2.mod(z_inv * z_inv, self.p)
+            result.append(EllipticCurvePoint._trusted(
+                x=gmpy2.mod(X * z_inv2, self.p),
+                y=gmpy2.mod(Y * z_inv2 * z_inv, self.p),
+                curve=self
+            ))
+        return result
+
+    @_instrumented
+    def batch_add(self, pairs: list) -> list:
+        """
+        Попарные суммы P + Q для списка пар точек: знаменатели всех наклонов обращаются одним вызовом
+        """
+        pairs = list(pairs)
+        denominators = []
+        for P, Q in pairs:
+            assert P.curve == self and Q.curve == self
+            if P.is_inf or Q.is_inf or (P.x == Q.x and gmpy2.mod(P.y + Q.y, self.p) == 0):
+                denominators.append(0)  # Обращение не нужно
+            elif P.x == Q.x:
+                denominators.append(2 * P.y)
+            else:
+                denominators.append(Q.x - P.x)
+
+        result = []
+        for (P, Q), inverse in zip(pairs, _batch_invert(denominators, self.p)):
+            if P.is_inf or Q.is_inf:
+                R = Q if P.is_inf else P
+                result.append(EllipticCurvePoint._trusted(x=R.x, y=R.y, curve=self, is_inf=R.is_inf))
+                continue
+            if inverse is None:
+                result.append(EllipticCurvePoint._trusted(x=gmpy2.mpz(0), y=gmpy2.mpz(0), curve=self, is_inf=True))
+                continue
+            if P.x == Q.x:
+                if _instrumentation is not None:
+                    _instrumentation.record(doublings=1, multiplications=4)
+                coeff = gmpy2.mod((3 * gmpy2.powmod(P.x, 2, self.p) + self.a) * inverse, self.p)
+            else:
+                if _instrumentation is not None:
+                    _instrumentation.record(additions=1, multiplications=3)
+                coeff = gmpy2.mod((Q.y - P.y) * inverse, self.p)
+            result_x = gmpy2.mod(gmpy2.powmod(coeff, 2, self.p) - P.x - Q.x, self.p)
+            result_y = gmpy2.mod(coeff * (P.x - result_x) - P.y, self.p)
+            result.append(EllipticCurvePoint._trusted(x=result_x, y=result_y, curve=self))
+        return result
+
+    def batch_double(self, points: list) -> list:
+        return self.batch_add((P, P) for P in points)
+
+
+def get_sqrt(x: gmpy2.mpz, p: gmpy2.mpz, params: tuple = None):
     """
-    Нахождение квадратного корня по модулю числа p алгоритмом Тонелли-Шенкса
+    Нахождение квадратного корня по модулю простого p: для p = 3 (mod 4) и p = 5 (mod 8) - одним возведением
+    в степень, иначе алгоритмом Тонелли-Шенкса с закэшированными для p параметрами (кривая передает свои)
     Нотация из книги, страница 122
     """
-    assert gmpy2.jacobi(x, p) == 1
-    state = gmpy2.random_state(hash(gmpy2.random_state()))
-    to_parse = p - 1
-    S = 0
-    for elem in gmpy2.digits(to_parse, 2)[::-1]:
-        if elem == '1':
-            break
-        S += 1
-    t = to_parse[S:]
-    d = gmpy2.mpz_random(state, p)
+    assert gmpy2.jacobi(x, p) != -1
+    x = gmpy2.mod(x, p)
+    if x == 0:
+        return x
+    if p % 4 == 3:
+        return gmpy2.powmod(x, (p + 1) // 4, p)
+    if p % 8 == 5:  # Алгоритм Аткина
+        v = gmpy2.powmod(2 * x, (p - 5) // 8, p)
+        i = gmpy2.mod(2 * x * v * v, p)
+        return gmpy2.mod(x * v * (i - 1), p)
+    S, t, D = params or _tonelli_shanks_params(p)
+    A = gmpy2.powmod(x, t, p)  # A лежит в подгруппе порядка 2^S, D - ее образующая
+    result = gmpy2.powmod(x, (t + 1) // 2, p)
+    m = S
+    while A != 1:
+        i = 0
+        square = A
+        while square != 1:  # Наименьшее i, для которого A^(2^i) == 1
+            square = gmpy2.mod(square * square, p)
+            i += 1
+        b = D
+        for _ in range(m - i - 1):
+            b = gmpy2.mod(b * b, p)
+        m = i
+        D = gmpy2.mod(b * b, p)
+        A = gmpy2.mod(A * D, p)
+        result = gmpy2.mod(result * b, p)
+    return result
+
+
+@functools.lru_cache(maxsize=64)
+def _tonelli_shanks_params(p: gmpy2.mpz) -> tuple:
+    """
+    Разложение p - 1 = 2^S * t с нечетным t и D = d^t для наименьшего квадратичного невычета d
+    """
+    p = gmpy2.mpz(p)
+    S = gmpy2.bit_scan1(p - 1)
+    t = (p - 1) >> S
+    return S, t, gmpy2.powmod(_non_residue(p), t, p)
+
+
+def _non_residue(p: gmpy2.mpz) -> gmpy2.mpz:
+    """
+    Наименьший квадратичный невычет по модулю p
+    """
+    d = gmpy2.mpz(2)
     while gmpy2.jacobi(d, p) != -1:
-        d = gmpy2.mpz_random(state, p)
-    D = gmpy2.powmod(d, t, p)
-    A = gmpy2.powmod(x, t, p)
-    m = gmpy2.mpz(0)
-    for i in range(1, S):
-        if gmpy2.powmod(gmpy2.mul(A, gmpy2.powmod(D, m, p)), gmpy2.powmod(2, S - 1 - i, p), p) == gmpy2.mod(-1, p):
-            m = gmpy2.add(m, gmpy2.powmod(2, i, p))
-    result = gmpy2.mod(gmpy2.mul(
-        gmpy2.powmod(x, gmpy2.divm(t + 1, 2, p), p),
-        gmpy2.powmod(D, gmpy2.divm(m, 2, p), p)), p
-    )
+        d += 1
+    return d
+
+
+def _batch_invert(values: list, p: gmpy2.mpz) -> list:
+    """
+    Обращение всех элементов списка по модулю p за одно обращение (прием Монтгомери), для нулевых - None
+    """
+    values = [gmpy2.mod(v, p) for v in values]
+    prefix = []
+    acc = gmpy2.mpz(1)
+    for v in values:
+        prefix.append(acc)
+        if v != 0:
+            acc = gmpy2.mod(acc * v, p)
+    inverse = gmpy2.invert(acc, p)
+    if _instrumentation is not None:
+        _instrumentation.record(inversions=1, multiplications=3 * sum(1 for v in values if v != 0))
+    result = [None] * len(values)
+    for i in range(len(values) - 1, -1, -1):
+        if values[i] != 0:
+            result[i] = gmpy2.mod(inverse * prefix[i], p)
+            inverse = gmpy2.mod(inverse * values[i], p)
     return result
 
 
+def _pollard_rho(n: gmpy2.mpz) -> gmpy2.mpz:
+    """
+    Нетривиальный делитель составного n методом Полларда в варианте Брента: длина цикла ищется степенями двойки,
+    НОД берется от произведения batch разностей, при n в НОД пакет повторяется по одному шагу
+    """
+    if n % 2 == 0:
+        return gmpy2.mpz(2)
+    batch = 128
+    c = gmpy2.mpz(1)
+    while True:
+        y = gmpy2.mpz(2)
+        r = 1
+        q = gmpy2.mpz(1)
+        d = gmpy2.mpz(1)
+        while d == 1:
+            x = y  # Точка отсчета, y уходит от нее на r шагов
+            for _ in range(r):
+                y = gmpy2.mod(y * y + c, n)
+            k = 0
+            while k < r and d == 1:
+                ys = y  # Начало пакета - для повтора по одному шагу
+                for _ in range(min(batch, r - k)):
+                    y = gmpy2.mod(y * y + c, n)
+                    q = gmpy2.mod(q * (x - y), n)
+                d = gmpy2.gcd(q, n)
+                k += batch
+            r *= 2
+        if d == n:
+            d = gmpy2.mpz(1)
+            while d == 1:
+                ys = gmpy2.mod(ys * ys + c, n)
+                d = gmpy2.gcd(x - ys, n)
+        if d != n:
+            return d
+        c += 1
+
+
+def _factorize(n: gmpy2.mpz) -> dict:
+    """
+    Разложение n на простые множители: {простое: степень}
+    """
+    n = gmpy2.mpz(n)
+    factors = {}
+    for q in (2, 3, 5, 7, 11, 13):
+        while n % q == 0:
+            factors[gmpy2.mpz(q)] = factors.get(q, 0) + 1
+            n //= q
+    stack = [n] if n > 1 else []
+    while stack:
+        m = stack.pop()
+        if gmpy2.is_prime(m):
+            factors[m] = factors.get(m, 0) + 1
+            continue
+        d = _pollard_rho(m)
+        stack.append(d)
+        stack.append(m // d)
+    return factors
+
+
+def _point_order(P: 'EllipticCurvePoint', N: gmpy2.mpz, factors: dict = None) -> gmpy2.mpz:
+    """
+    Порядок точки P по известному кратному N (N * P == бесконечность) и, если есть, его разложению
+    """
+    order = gmpy2.mpz(N)
+    for q, e in (factors or _factorize(N)).items():
+        for _ in range(e):
+            if not P.ternary_mul(order // q).is_inf:
+                break
+            order //= q
+    return order
+
+
+_CURVE_TABLES_CACHE_SIZE = 64  # Таблиц baby steps на кривую, вытесняются по LRU
+_BSGS_LOG_LIMIT = 1 << 24  # Подгруппы большего порядка решаются методом rho Полларда без таблиц
+
+
+def _subgroup_log(gamma: 'EllipticCurvePoint', h: 'EllipticCurvePoint', q: gmpy2.mpz) -> gmpy2.mpz:
+    """
+    Логарифм h по основанию gamma в подгруппе простого порядка q
+    """
+    if h.is_inf:
+        return gmpy2.mpz(0)
+    if q > _BSGS_LOG_LIMIT:
+        return _pollard_rho_log(gamma, h, q)
+    tables = gamma.curve._log_tables
+    m = gmpy2.isqrt(q - 1) + 1
+    key = (gamma.x, gamma.y, q)
+    table = tables.get(key)
+    if table is None:
+        table = {}
+        R = EllipticCurvePoint._trusted(x=gmpy2.mpz(0), y=gmpy2.mpz(0), curve=gamma.curve, is_inf=True)
+        for j in range(m):
+            table.setdefault((R.x, R.y, R.is_inf), j)
+            R = R + gamma
+        tables[key] = table
+        while len(tables) > _CURVE_TABLES_CACHE_SIZE:
+            tables.popitem(last=False)
+    tables.move_to_end(key)
+    step = -gamma.ternary_mul(m)
+    R = h
+    for i in range(m):
+        j = table.get((R.x, R.y, R.is_inf))
+        if j is not None:
+            return gmpy2.mod(i * m + j, q)
+        R = R + step
+    raise ArithmeticError("h is not in the subgroup generated by gamma")
+
+
+def _pollard_rho_log(gamma: 'EllipticCurvePoint', h: 'EllipticCurvePoint', q: gmpy2.mpz) -> gmpy2.mpz:
+    """
+    Логарифм в подгруппе простого порядка q методом rho Полларда: блуждание R = a * gamma + b * h
+    с разбиением на три класса по x mod 3 и поиском цикла по Флойду
+    """
+    state = gmpy2.random_state(int(q))  # Детерминированные стартовые точки
+
+    def step(R, a, b):
+        if R.is_inf or R.x % 3 == 0:
+            return R + h, a, gmpy2.mod(b + 1, q)
+        if R.x % 3 == 1:
+            return R + R, gmpy2.mod(2 * a, q), gmpy2.mod(2 * b, q)
+        return R + gamma, gmpy2.mod(a + 1, q), b
+
+    while True:
+        a = gmpy2.mpz_random(state, q)
+        b = gmpy2.mpz_random(state, q)
+        start = gamma.ternary_mul(a) + h.ternary_mul(b) if b else gamma.ternary_mul(a)
+        slow = fast = (start, a, b)
+        while True:
+            slow = step(*slow)
+            fast = step(*step(*fast))
+            if slow[0] == fast[0]:
+                break
+        denominator = gmpy2.mod(slow[2] - fast[2], q)
+        if denominator != 0:
+            return gmpy2.divm(fast[1] - slow[1], denominator, q)
+
+
+# Точка в координатах Якоби (X, Y, Z) соответствует аффинной (X / Z^2, Y / Z^3), Z == 0 - бесконечность
+_JACOBIAN_INF = (gmpy2.mpz(1), gmpy2.mpz(1), gmpy2.mpz(0))
+
+
+def _jacobian_add(P: tuple, Q: tuple, a: gmpy2.mpz, p: gmpy2.mpz) -> tuple:
+    """
+    Сложение двух точек в координатах Якоби
+    """
+    X1, Y1, Z1 = P
+    X2, Y2, Z2 = Q
+    if Z1 == 0:
+        return Q
+    if Z2 == 0:
+        return P
+    Z1Z1 = gmpy2.mod(Z1 * Z1, p)
+    Z2Z2 = gmpy2.mod(Z2 * Z2, p)
+    U1 = gmpy2.mod(X1 * Z2Z2, p)
+    U2 = gmpy2.mod(X2 * Z1Z1, p)
+    S1 = gmpy2.mod(Y1 * Z2 * Z2Z2, p)
+    S2 = gmpy2.mod(Y2 * Z1 * Z1Z1, p)
+    H = gmpy2.mod(U2 - U1, p)
+    r = gmpy2.mod(S2 - S1, p)
+    if H == 0:
+        if _instrumentation is not None:
+            _instrumentation.record(multiplications=8)
+        if r == 0:
+            return _jacobian_double(P, a, p)
+        return _JACOBIAN_INF
+    HH = gmpy2.mod(H * H, p)
+    HHH = gmpy2.mod(H * HH, p)
+    V = gmpy2.mod(U1 * HH, p)
+    X3 = gmpy2.mod(r * r - HHH - 2 * V, p)
+    Y3 = gmpy2.mod(r * (V - X3) - S1 * HHH, p)
+    Z3 = gmpy2.mod(Z1 * Z2 * H, p)
+    if _instrumentation is not None:
+        _instrumentation.record(additions=1, multiplications=16)
+    return X3, Y3, Z3
+
+
+def _jacobian_double(P: tuple, a: gmpy2.mpz, p: gmpy2.mpz) -> tuple:
+    """
+    Удвоение точки в координатах Якоби без обращения по модулю
+    """
+    X1, Y1, Z1 = P
+    if Z1 == 0 or Y1 == 0:
+        return _JACOBIAN_INF
+    YY = gmpy2.mod(Y1 * Y1, p)
+    S = gmpy2.mod(4 * X1 * YY, p)
+    ZZ = gmpy2.mod(Z1 * Z1, p)
+    M = gmpy2.mod(3 * X1 * X1 + a * ZZ * ZZ, p)
+    X3 = gmpy2.mod(M * M - 2 * S, p)
+    Y3 = gmpy2.mod(M * (S - X3) - 8 * YY * YY, p)
+    Z3 = gmpy2.mod(2 * Y1 * Z1, p)
+    if _instrumentation is not None:
+        _instrumentation.record(doublings=1, multiplications=10)
+    return X3, Y3, Z3
+
+
+def _jacobian_add_affine(P: tuple, x2: gmpy2.mpz, y2: gmpy2.mpz, a: gmpy2.mpz, p: gmpy2.mpz) -> tuple:
+    """
+    Смешанное сложение: P в координатах Якоби, (x2, y2) - конечная аффинная точка
+    """
+    X1, Y1, Z1 = P
+    if Z1 == 0:
+        return gmpy2.mpz(x2), gmpy2.mpz(y2), gmpy2.mpz(1)
+    Z1Z1 = gmpy2.mod(Z1 * Z1, p)
+    U2 = gmpy2.mod(x2 * Z1Z1, p)
+    S2 = gmpy2.mod(y2 * Z1 * Z1Z1, p)
+    H = gmpy2.mod(U2 - X1, p)
+    r = gmpy2.mod(S2 - Y1, p)
+    if H == 0:
+        if _instrumentation is not None:
+            _instrumentation.record(multiplications=4)
+        if r == 0:  # P == (x2, y2)
+            return _jacobian_double(P, a, p)
+        return _JACOBIAN_INF  # P == -(x2, y2)
+    HH = gmpy2.mod(H * H, p)
+    HHH = gmpy2.mod(H * HH, p)
+    V = gmpy2.mod(X1 * HH, p)
+    X3 = gmpy2.mod(r * r - HHH - 2 * V, p)
+    Y3 = gmpy2.mod(r * (V - X3) - Y1 * HHH, p)
+    Z3 = gmpy2.mod(Z1 * H, p)
+    if _instrumentation is not None:
+        _instrumentation.record(additions=1, multiplications=11)
+    return X3, Y3, Z3
+
+
+def _wnaf_width(bits: int) -> int:
+    """
+    Ширина окна w-NAF по длине скаляра: таблица из 2^(w-2) нечетных кратных должна окупаться
+    экономией сложений, их число около bits / (w + 1)
+    """
+    for width, limit in ((2, 16), (3, 48), (4, 640)):
+        if bits <= limit:
+            return width
+    return 5
+
+
+def _wnaf_digits(num: gmpy2.mpz, width: int) -> list:
+    """
+    Цифры w-NAF неотрицательного num от младших к старшим
+    """
+    digits = []
+    k = int(num)
+    modulus = 1 << width
+    while k > 0:
+        if k & 1:
+            d = k & (modulus - 1)
+            if d >= modulus >> 1:
+                d -= modulus
+            k -= d
+        else:
+            d = 0
+        digits.append(d)
+        k >>= 1
+    return digits
+
+
+def _odd_multiples(points: list, width: int) -> list:
+    """
+    Таблицы нечетных кратных P, 3P, ..., (2^(w-1) - 1)P в аффинных координатах (None - бесконечность)
+    для каждой конечной точки списка, все обращения общие
+    """
+    if width == 2:
+        return [[(P.x, P.y)] for P in points]
+    curve = points[0].curve
+    a, p = curve.a, curve.p
+    doubles = curve.batch_double(points)
+    jacobian = []
+    for P, double in zip(points, doubles):
+        current = (gmpy2.mpz(P.x), gmpy2.mpz(P.y), gmpy2.mpz(1))
+        for _ in range(1, 1 << (width - 2)):
+            if not double.is_inf:
+                current = _jacobian_add_affine(current, double.x, double.y, a, p)
+            jacobian.append(current)
+    affine = [None if entry.is_inf else (entry.x, entry.y) for entry in curve._batch_to_affine(jacobian)]
+    size = (1 << (width - 2)) - 1
+    return [[(P.x, P.y)] + affine[i * size:(i + 1) * size] for i, P in enumerate(points)]
+
+
+# Таблицы режима фиксированной базы: (a, b, p, x, y) -> (ширина окна, строки таблицы), вытесняются по LRU
+_FIXED_BASE_CACHE_SIZE = 16
+_fixed_base_tables = collections.OrderedDict()
+
+
 class EllipticCurvePoint:
+    __slots__ = ('x', 'y', 'curve', 'is_inf')
+
     def __init__(
             self,
             x: gmpy2.mpz,
@@ -125,6 +726,8 @@ class EllipticCurvePoint:
             self.x = 0
             self.y = 0
         else:
+            if _instrumentation is not None:
+                _instrumentation.record(validations=1)
             assert gmpy2.powmod(y, 2, curve.p) == gmpy2.mod(gmpy2.powmod(x, 3, curve.p) + curve.a * x + curve.b,
                                                             curve.p)
             self.x = x
@@ -133,10 +736,26 @@ class EllipticCurvePoint:
         self.curve = curve
         self.is_inf = is_inf
 
+    @classmethod
+    def _trusted(cls, x: gmpy2.mpz, y: gmpy2.mpz, curve: EllipticCurve, is_inf=False) -> 'EllipticCurvePoint':
+        """
+        Создание точки без проверки уравнения кривой - только для результатов, вычисленных внутри модуля
+        """
+        point = object.__new__(cls)
+        if is_inf:
+            point.x = 0
+            point.y = 0
+        else:
+            point.x = x
+            point.y = y
+        point.curve = curve
+        point.is_inf = is_inf
+        return point
+
     def __add__(self, other: 'EllipticCurvePoint') -> 'EllipticCurvePoint':
-        assert self.curve == other.curve
+        assert self.curve is other.curve or self.curve == other.curve
         if self.is_inf:
-            return EllipticCurvePoint(
+            return EllipticCurvePoint._trusted(
                 x=other.x,
                 y=other.y,
                 curve=other.curve,
@@ -144,18 +763,20 @@ class EllipticCurvePoint:
             )
 
         if other.is_inf:
-            return EllipticCurvePoint(
+            return EllipticCurvePoint._trusted(
                 x=self.x,
                 y=self.y,
                 curve=self.curve,
                 is_inf=self.is_inf
             )
 
-        if self == other:
+        if self.x == other.x and self.y == other.y and self.y != 0:  # Удвоение точки второго порядка дает бесконечность ниже
+            if _instrumentation is not None:
+                _instrumentation.record(doublings=1, inversions=1, multiplications=4)
             coeff = gmpy2.divm(3 * gmpy2.powmod(self.x, 2, self.curve.p) + self.curve.a, 2 * self.y, self.curve.p)
         else:
             if self.x == other.x:
-                return EllipticCurvePoint(
+                return EllipticCurvePoint._trusted(
                     x=gmpy2.mpz(0),
                     y=gmpy2.mpz(0),
                     curve=self.curve,
@@ -163,28 +784,35 @@ class EllipticCurvePoint:
 
                 )
             else:
+                if _instrumentation is not None:
+                    _instrumentation.record(additions=1, inversions=1, multiplications=3)
                 coeff = gmpy2.divm(other.y - self.y, other.x - self.x, self.curve.p)
 
         result_x = gmpy2.mod(gmpy2.powmod(coeff, 2, self.curve.p) - self.x - other.x, self.curve.p)
         result_y = gmpy2.mod(coeff * (self.x - result_x) - self.y, self.curve.p)
-        return EllipticCurvePoint(
+        return EllipticCurvePoint._trusted(
             x=result_x,
             y=result_y,
             curve=self.curve
         )
 
     def __neg__(self) -> 'EllipticCurvePoint':
-        return EllipticCurvePoint(
+        if self.is_inf:
+            return self
+        return EllipticCurvePoint._trusted(
             x=self.x,
             y=gmpy2.mod(-self.y, self.curve.p),
             curve=self.curve
         )
 
     def __mul__(self, num: gmpy2.mpz) -> 'EllipticCurvePoint':
-        return self.ternary_mul(num)
+        if self._fixed_base_key() in _fixed_base_tables:
+            return self.fixed_base_mul(num)
+        return self.wnaf_mul(num)
 
     def __eq__(self, other) -> bool:
-        return self.x == other.x and self.y == other.y and self.curve == other.curve
+        return (self.x == other.x and self.y == other.y and
+                (self.curve is other.curve or self.curve == other.curve))
 
     def __str__(self) -> str:
         return f"[{self.x}, {self.y}], if_inf: {self.is_inf}"
@@ -193,18 +821,87 @@ class EllipticCurvePoint:
         return hash(self.x) + hash(self.y) + hash(self.is_inf) + hash(self.curve.a) + hash(self.curve.b) + hash(
             self.curve.p)
 
+    def to_bytes(self, compressed: bool = True) -> bytes:
+        """
+        Кодирование SEC1: 0x00 - бесконечность, 0x02/0x03 + x - сжатая точка (младший бит y в префиксе),
+        0x04 + x + y - несжатая. Координаты - big-endian длины (p.bit_length() + 7) // 8 байт
+        """
+        if self.is_inf:
+            return b'\x00'
+        size = _field_size(self.curve.p)
+        if compressed:
+            return bytes([2 + int(self.y & 1)]) + int(self.x).to_bytes(size, 'big')
+        return b'\x04' + int(self.x).to_bytes(size, 'big') + int(self.y).to_bytes(size, 'big')
+
+    @classmethod
+    def from_bytes(cls, data: bytes, curve: EllipticCurve) -> 'EllipticCurvePoint':
+        """
+        Разбор кодировки SEC1 (bytes, bytearray или memoryview) с проверкой принадлежности точки кривой
+        """
+        data = memoryview(data)
+        size = _field_size(curve.p)
+        # Данные приходят извне, поэтому проверки - исключения, а не assert, который снимается при -O
+        if len(data) == 0:
+            raise ValueError("empty point encoding")
+        prefix = data[0]
+        if prefix == 0:
+            if len(data) != 1:
+                raise ValueError("invalid length of the point at infinity encoding")
+            return cls._trusted(x=gmpy2.mpz(0), y=gmpy2.mpz(0), curve=curve, is_inf=True)
+        if prefix not in (2, 3, 4):
+            raise ValueError(f"unknown point encoding prefix {prefix:#04x}")
+        if len(data) != (2 * size + 1 if prefix == 4 else size + 1):
+            raise ValueError("invalid point encoding length")
+        x = gmpy2.mpz(int.from_bytes(data[1:size + 1], 'big'))
+        if x >= curve.p:
+            raise ValueError("x coordinate is not reduced modulo p")
+        t = gmpy2.mod(gmpy2.mul(x, gmpy2.powmod(x, 2, curve.p) + curve.a) + curve.b, curve.p)
+        if prefix == 4:
+            y = gmpy2.mpz(int.from_bytes(data[size + 1:], 'big'))
+            if y >= curve.p:
+                raise ValueError("y coordinate is not reduced modulo p")
+            if gmpy2.powmod(y, 2, curve.p) != t:
+                raise ValueError("point is not on the curve")
+            return cls._trusted(x=x, y=y, curve=curve)
+        if gmpy2.jacobi(t, curve.p) == -1:
+            raise ValueError("x is not the abscissa of a curve point")
+        y = get_sqrt(t, curve.p, curve._sqrt_params)
+        if (y & 1) != (prefix & 1):
+            y = gmpy2.mod(-y, curve.p)
+        if (y & 1) != (prefix & 1):  # При y == 0 второго корня нет, префикс 0x03 недопустим
+            raise ValueError("parity prefix does not match the point")
+        return cls._trusted(x=x, y=y, curve=curve)
+
+    def _from_jacobian(self, P: tuple) -> 'EllipticCurvePoint':
+        # Единственное обращение по модулю - при переходе обратно к аффинным координатам
+        X, Y, Z = P
+        if Z == 0:
+            return EllipticCurvePoint._trusted(x=gmpy2.mpz(0), y=gmpy2.mpz(0), curve=self.curve, is_inf=True)
+        z_inv = gmpy2.invert(Z, self.curve.p)
+        if _instrumentation is not None:
+            _instrumentation.record(inversions=1, multiplications=4)
+        z_inv2 = gmpy2.mod(z_inv * z_inv, self.curve.p)
+        return EllipticCurvePoint._trusted(
+            x=gmpy2.mod(X * z_inv2, self.curve.p),
+            y=gmpy2.mod(Y * z_inv2 * z_inv, self.curve.p),
+            curve=self.curve
+        )
+
+    @_instrumented
     def double_and_add(self, num: gmpy2.mpz) -> 'EllipticCurvePoint':
         if self.is_inf:
             return self
         if type(num) == int:
             num = gmpy2.mpz(num)
-        result = EllipticCurvePoint(x=gmpy2.mpz(0), y=gmpy2.mpz(0), curve=self.curve, is_inf=True)
+        a, p = self.curve.a, self.curve.p
+        result = _JACOBIAN_INF
         for ind, bit in enumerate(num.digits(2)):
-            result = result + result
+            result = _jacobian_double(result, a, p)
             if bit == '1':
-                result = result + self
-        return result
+                result = _jacobian_add_affine(result, self.x, self.y, a, p)
+        return self._from_jacobian(result)
 
+    @_instrumented
     def ternary_mul(self, num: gmpy2.mpz):
         if self.is_inf:
             return self
@@ -236,12 +933,362 @@ class EllipticCurvePoint:
             for i in range(seq_len):
                 ternary.append(1)
 
-        result = EllipticCurvePoint(x=0, y=0, curve=self.curve, is_inf=True)
-        T = EllipticCurvePoint(x=self.x, y=self.y, curve=self.curve, is_inf=self.is_inf)
-        for elem in ternary:
+        # Проход от старших разрядов к младшим: result = 2 * result +- P
+        a, p = self.curve.a, self.curve.p
+        neg_y = gmpy2.mod(-self.y, p)
+        result = _JACOBIAN_INF
+        for elem in ternary[::-1]:
+            result = _jacobian_double(result, a, p)
             if elem == 1:
-                result = result + T
+                result = _jacobian_add_affine(result, self.x, self.y, a, p)
             elif elem == -1:
-                result = result + (-T)
-            T = T + T
+                result = _jacobian_add_affine(result, self.x, neg_y, a, p)
+        return self._from_jacobian(result)
+
+    @_instrumented
+    def wnaf_mul(self, num: gmpy2.mpz, width: int = None) -> 'EllipticCurvePoint':
+        """
+        Умножение по w-NAF (знаковое скользящее окно): ненулевые цифры нечетны, |d| < 2^(w-1),
+        между ними не меньше w - 1 нулей. Ширина окна по умолчанию выбирается по длине скаляра
+        """
+        if self.is_inf:
+            return self
+        num = gmpy2.mpz(num)
+        if num < 0:
+            return (-self).wnaf_mul(-num, width)
+        if width is None:
+            width = _wnaf_width(num.bit_length())
+        assert width >= 2
+
+        a, p = self.curve.a, self.curve.p
+        digits = _wnaf_digits(num, width)
+        odd = _odd_multiples([self], width)[0]
+        result = _JACOBIAN_INF
+        for d in digits[::-1]:
+            result = _jacobian_double(result, a, p)
+            if d == 0 or odd[abs(d) >> 1] is None:
+                continue
+            x, y = odd[abs(d) >> 1]
+            result = _jacobian_add_affine(result, x, y if d > 0 else gmpy2.mod(-y, p), a, p)
+        return self._from_jacobian(result)
+
+    @_instrumented
+    def order(self) -> gmpy2.mpz:
+        """
+        Порядок точки по порядку группы и его разложению, оба кэшируются для кривой
+        """
+        if self.is_inf:
+            return gmpy2.mpz(1)
+        return _point_order(self, self.curve.calculate_order(), self.curve._order_factors)
+
+    @_instrumented
+    def discrete_log(self, Q: 'EllipticCurvePoint') -> gmpy2.mpz:
+        """
+        Наименьшее k >= 0, для которого k * self == Q, методом Полига-Хеллмана: логарифмы по модулю степеней
+        простых делителей порядка self находятся в подгруппах простого порядка и собираются по КТО
+        """
+        assert self.curve == Q.curve
+        n = self.order()
+        assert Q.ternary_mul(n).is_inf  # Q не лежит в подгруппе, порожденной self
+        result, modulus = gmpy2.mpz(0), gmpy2.mpz(1)
+        for q in self.curve._order_factors:
+            e = 0
+            while n % q ** (e + 1) == 0:
+                e += 1
+            if e == 0:
+                continue
+            gamma = self.ternary_mul(n // q)
+            x = gmpy2.mpz(0)
+            for k in range(e):
+                h = (Q + -self.ternary_mul(x)) if x else Q
+                x += _subgroup_log(gamma, h.ternary_mul(n // q ** (k + 1)), q) * q ** k
+            result += modulus * gmpy2.mod((x - result) * gmpy2.invert(modulus, q ** e), q ** e)
+            modulus *= q ** e
+        assert self.ternary_mul(result) == Q
         return result
+
+    def _fixed_base_key(self) -> tuple:
+        return self.curve.a, self.curve.b, self.curve.p, self.x, self.y
+
+    @_instrumented
+    def precompute(self, window: int = 4) -> 'EllipticCurvePoint':
+        """
+        Включение режима фиксированной базы: строка i таблицы содержит d * 2^(window * i) * P, d = 1..2^window - 1,
+        строк хватает на скаляры длины p.bit_length() + 1 бит. Таблица общая для равных точек одной кривой
+        """
+        assert 1 <= window <= 8
+        key = self._fixed_base_key()
+        cached = _fixed_base_tables.get(key)
+        if cached is not None and cached[0] == window:
+            _fixed_base_tables.move_to_end(key)
+            return self
+        if self.is_inf:
+            return self
+        a, p = self.curve.a, self.curve.p
+        size = (1 << window) - 1
+        bases = [(gmpy2.mpz(self.x), gmpy2.mpz(self.y), gmpy2.mpz(1))]
+        for _ in range(-(-(p.bit_length() + 1) // window) - 1):
+            base = bases[-1]
+            for _ in range(window):
+                base = _jacobian_double(base, a, p)
+            bases.append(base)
+        entries = []
+        for base_point in self.curve._batch_to_affine(bases):
+            current = _JACOBIAN_INF
+            for d in range(size):
+                if not base_point.is_inf:
+                    current = _jacobian_add_affine(current, base_point.x, base_point.y, a, p)
+                entries.append(current)
+        entries = [None if entry.is_inf else (entry.x, entry.y) for entry in self.curve._batch_to_affine(entries)]
+        rows = [entries[i:i + size] for i in range(0, len(entries), size)]
+        _fixed_base_tables[key] = (window, rows)
+        _fixed_base_tables.move_to_end(key)
+        while len(_fixed_base_tables) > _FIXED_BASE_CACHE_SIZE:
+            _fixed_base_tables.popitem(last=False)
+        return self
+
+    @_instrumented
+    def fixed_base_mul(self, num: gmpy2.mpz) -> 'EllipticCurvePoint':
+        """
+        Умножение по таблице precompute: по одному сложению на окно, без удвоений
+        """
+        if self.is_inf:
+            return self
+        key = self._fixed_base_key()
+        cached = _fixed_base_tables.get(key)
+        if cached is None:
+            cached = _fixed_base_tables[self.precompute()._fixed_base_key()]
+        else:
+            _fixed_base_tables.move_to_end(key)
+        window, rows = cached
+        num = gmpy2.mpz(num)
+        if num < 0 or num.bit_length() > window * len(rows):
+            return self.wnaf_mul(num)
+        a, p = self.curve.a, self.curve.p
+        mask = (1 << window) - 1
+        result = _JACOBIAN_INF
+        for row in rows:
+            if num == 0:
+                break
+            d = num & mask
+            if d and row[d - 1] is not None:
+                result = _jacobian_add_affine(result, row[d - 1][0], row[d - 1][1], a, p)
+            num >>= window
+        return self._from_jacobian(result)
+
+
+def _field_size(p: gmpy2.mpz) -> int:
+    return (p.bit_length() + 7) // 8
+
+
+class PointBuffer:
+    """
+    Упакованный массив точек одной кривой с записями фиксированной длины.
+    Заголовок: b'ECPB', версия, флаги (бит 0 - сжатые записи), длина координаты, число точек, затем a, b, p.
+    Запись - кодировка SEC1, бесконечность - нулевой байт, дополненный нулями до длины записи.
+    Записи читаются через memoryview исходного буфера (bytes, bytearray, mmap) без копирования
+    """
+    _HEADER = struct.Struct('>4sBBHQ')
+    _MAGIC = b'ECPB'
+    _VERSION = 1
+
+    def __init__(self, buffer, curve: EllipticCurve = None):
+        self._view = memoryview(buffer)
+        if len(self._view) < self._HEADER.size:
+            raise ValueError("truncated point buffer header")
+        magic, version, flags, size, count = self._HEADER.unpack_from(self._view)
+        if magic != self._MAGIC or version != self._VERSION:
+            raise ValueError("not a point buffer or unsupported version")
+        offset = self._HEADER.size
+        if len(self._view) < offset + 3 * size:
+            raise ValueError("truncated curve parameters")
+        a, b, p = (gmpy2.mpz(int.from_bytes(self._view[offset + i * size:offset + (i + 1) * size], 'big'))
+                   for i in range(3))
+        if curve is None:
+            curve = EllipticCurve(a=a, b=b, p=p)
+        if curve.a != a or curve.b != b or curve.p != p:
+            raise ValueError("point buffer belongs to another curve")
+        self.curve = curve
+        self.compressed = bool(flags & 1)
+        self.record_size = 1 + size if self.compressed else 1 + 2 * size
+        offset += 3 * size
+        if size != _field_size(curve.p) or len(self._view) < offset + count * self.record_size:
+            raise ValueError("truncated point buffer records")
+        self._records = self._view[offset:offset + count * self.record_size]
+        self._count = count
+        self._mmap = None
+
+    @classmethod
+    def pack(cls, curve: EllipticCurve, points: list, compressed: bool = False) -> bytes:
+        size = _field_size(curve.p)
+        record_size = 1 + size if compressed else 1 + 2 * size
+        records = []
+        for P in points:
+            assert P.curve == curve
+            records.append(P.to_bytes(compressed).ljust(record_size, b'\x00'))
+        header = cls._HEADER.pack(cls._MAGIC, cls._VERSION, int(compressed), size, len(records))
+        params = b''.join(int(v).to_bytes(size, 'big') for v in (curve.a, curve.b, curve.p))
+        return header + params + b''.join(records)
+
+    @classmethod
+    def open(cls, path: str, curve: EllipticCurve = None) -> 'PointBuffer':
+        """
+        Отображение файла в память: записи читаются по мере обращения
+        """
+        with open(path, 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = cls(mapped, curve)
+        buffer._mmap = mapped
+        return buffer
+
+    def close(self):
+        self._records.release()
+        self._view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+
+    def __enter__(self) -> 'PointBuffer':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def record(self, index: int) -> memoryview:
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        return self._records[index * self.record_size:(index + 1) * self.record_size]
+
+    def __getitem__(self, index: int) -> EllipticCurvePoint:
+        record = self.record(index)
+        if record[0] == 0:
+            return EllipticCurvePoint.from_bytes(record[:1], self.curve)
+        return EllipticCurvePoint.from_bytes(record, self.curve)
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self[index]
+
+
+def _chunks(iterable, size: int):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+@functools.lru_cache(maxsize=8)
+def _curve_from_params(params: bytes) -> EllipticCurve:
+    return PointBuffer(params).curve
+
+
+def _parallel_mul(params: bytes, encoded: bytes, scalars: list) -> bytes:
+    curve = _curve_from_params(params)
+    P = EllipticCurvePoint.from_bytes(encoded, curve)
+    if len(scalars) >= 16:  # Таблица фиксированной базы остается в кэше процесса для следующих частей
+        P.precompute()
+    return PointBuffer.pack(curve, [P * k for k in scalars])
+
+
+def _parallel_generate(params: bytes, seed: int, count: int) -> bytes:
+    curve = _curve_from_params(params)
+    state = gmpy2.random_state(seed)
+    return PointBuffer.pack(curve, [curve.generate_point(state) for _ in range(count)])
+
+
+def _stream_parallel(curve: EllipticCurve, function, tasks, workers: int = None):
+    """
+    Выполнение задач function(*task) в пуле процессов не более чем с 2 * workers задачами в работе,
+    результаты (упакованные PointBuffer) разбираются и отдаются в порядке задач
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for task in tasks:
+            yield from PointBuffer(function(*task), curve)
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = collections.deque()
+        try:
+            for task in tasks:
+                pending.append(pool.submit(function, *task))
+                if len(pending) >= 2 * workers:
+                    yield from PointBuffer(pending.popleft().result(), curve)
+            while pending:
+                yield from PointBuffer(pending.popleft().result(), curve)
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+@_instrumented
+def multi_scalar_mul(points: list, scalars: list) -> EllipticCurvePoint:
+    """
+    Сумма k1 * P1 + ... + kn * Pn на общей цепочке удвоений: для небольших n - чередование w-NAF (Штраус),
+    для больших - корзины Пиппенгера
+    """
+    points, scalars = list(points), [gmpy2.mpz(k) for k in scalars]
+    assert points and len(points) == len(scalars)
+    curve = points[0].curve
+    pairs = []
+    for P, k in zip(points, scalars):
+        assert P.curve == curve
+        if P.is_inf or k == 0:
+            continue
+        pairs.append((-P, -k) if k < 0 else (P, k))
+    if not pairs:
+        return EllipticCurvePoint._trusted(x=gmpy2.mpz(0), y=gmpy2.mpz(0), curve=curve, is_inf=True)
+    if len(pairs) < 64:
+        result = _straus(pairs, curve)
+    else:
+        result = _pippenger(pairs, curve)
+    return pairs[0][0]._from_jacobian(result)
+
+
+def _straus(pairs: list, curve: EllipticCurve) -> tuple:
+    a, p = curve.a, curve.p
+    width = _wnaf_width(max(k.bit_length() for _, k in pairs))
+    tables = _odd_multiples([P for P, _ in pairs], width)
+    digits = [_wnaf_digits(k, width) for _, k in pairs]
+    result = _JACOBIAN_INF
+    for i in range(max(len(d) for d in digits) - 1, -1, -1):
+        result = _jacobian_double(result, a, p)
+        for table, point_digits in zip(tables, digits):
+            if i >= len(point_digits) or point_digits[i] == 0:
+                continue
+            d = point_digits[i]
+            if table[abs(d) >> 1] is None:
+                continue
+            x, y = table[abs(d) >> 1]
+            result = _jacobian_add_affine(result, x, y if d > 0 else gmpy2.mod(-y, p), a, p)
+    return result
+
+
+def _pippenger(pairs: list, curve: EllipticCurve) -> tuple:
+    a, p = curve.a, curve.p
+    c = max(2, len(pairs).bit_length() - 3)  # Ширина окна растет как log2(n)
+    mask = (1 << c) - 1
+    bits = max(k.bit_length() for _, k in pairs)
+    result = _JACOBIAN_INF
+    for shift in range(-(-bits // c) * c - c, -1, -c):
+        for _ in range(c):
+            result = _jacobian_double(result, a, p)
+        buckets = [_JACOBIAN_INF] * (mask + 1)
+        for P, k in pairs:
+            d = (k >> shift) & mask
+            if d:
+                buckets[d] = _jacobian_add_affine(buckets[d], P.x, P.y, a, p)
+        # sum(d * bucket[d]) = сумма частичных сумм корзин от старших к младшим
+        running = _JACOBIAN_INF
+        window = _JACOBIAN_INF
+        for d in range(mask, 0, -1):
+            running = _jacobian_add(running, buckets[d], a, p)
+            window = _jacobian_add(window, running, a, p)
+        result = _jacobian_add(result, window, a, p)
+    return result
@@ -1,5 +1,15 @@
+import asyncio
+import benchmark
 import gmpy2
-from elliptic_curve import EllipticCurve, EllipticCurvePoint
+import os
+import pickle
+import tempfile
+import async_service
+from async_service import CurveService
+from elliptic_curve import (EllipticCurve, EllipticCurvePoint, Instrumentation, PointBuffer, get_sqrt, multi_scalar_mul,
+                            _factorize, _jacobian_add_affine, _pollard_rho_log)
+from schoof import schoof_order
+import small_field
 import unittest
 
 
@@ -55,6 +65,50 @@ class Test(unittest.TestCase):
         self.assertEqual(result.y, gmpy2.mpz("11418188651670813883077556494707288656076989565581420853248143655109705181047795022477878321382564008989610294898802890161014306"))
         self.assertEqual(result.is_inf, False)
 
+    def test_batch(self) -> None:
+        curve = EllipticCurve(a=gmpy2.mpz(13), b=gmpy2.mpz(32), p=gmpy2.mpz(67))
+        P = EllipticCurvePoint(x=gmpy2.mpz(7), y=gmpy2.mpz(8), curve=curve)
+        points = [P.double_and_add(k) for k in range(0, 30)]
+        pairs = [(Q, R) for Q in points for R in points]
+        for result, (Q, R) in zip(curve.batch_add(pairs), pairs):
+            self.assertEqual((result.x, result.y, result.is_inf), ((Q + R).x, (Q + R).y, (Q + R).is_inf))
+        for result, Q in zip(curve.batch_double(points), points):
+            self.assertEqual((result.x, result.y, result.is_inf), ((Q + Q).x, (Q + Q).y, (Q + Q).is_inf))
+
+        jacobian = [(gmpy2.mpz(7 * 4), gmpy2.mpz(8 * 8), gmpy2.mpz(2)), (gmpy2.mpz(1), gmpy2.mpz(1), gmpy2.mpz(0))]
+        result = curve._batch_to_affine(jacobian)
+        self.assertEqual((result[0].x, result[0].y, result[0].is_inf), (7, 8, False))
+        self.assertEqual(result[1].is_inf, True)
+
+    def test_multi_scalar_mul(self) -> None:
+        curve = EllipticCurve(a=gmpy2.mpz(13), b=gmpy2.mpz(32), p=gmpy2.mpz(1009))
+        P = EllipticCurvePoint(x=gmpy2.mpz(3), y=gmpy2.mpz(46), curve=curve)
+        for count in (1, 2, 5, 70):
+            points = [P.double_and_add(3 * i + 1) for i in range(count)]
+            scalars = [(-1) ** i * (7919 * i + 5) for i in range(count)]
+            expected = EllipticCurvePoint(x=gmpy2.mpz(0), y=gmpy2.mpz(0), curve=curve, is_inf=True)
+            for Q, k in zip(points, scalars):
+                expected = expected + (Q.double_and_add(k) if k > 0 else -Q.double_and_add(-k))
+            result = multi_scalar_mul(points, scalars)
+            self.assertEqual((result.x, result.y, result.is_inf), (expected.x, expected.y, expected.is_inf))
+
+    def test_point_construction(self) -> None:
+        curve = EllipticCurve(a=gmpy2.mpz(13), b=gmpy2.mpz(32), p=gmpy2.mpz(67))
+        with self.assertRaises(AssertionError):
+            EllipticCurvePoint(x=gmpy2.mpz(7), y=gmpy2.mpz(9), curve=curve)
+        P = EllipticCurvePoint(x=gmpy2.mpz(7), y=gmpy2.mpz(8), curve=curve)
+        self.assertFalse(hasattr(P, "__dict__"))
+        self.assertIs((P + P).curve, curve)
+        self.assertEqual(((-P).x, (-P).y), (7, 59))
+
+        inf = P + (-P)
+        self.assertEqual(inf.is_inf, True)
+        self.assertEqual((-inf).is_inf, True)
+
+        same_curve = EllipticCurve(a=gmpy2.mpz(13), b=gmpy2.mpz(32), p=gmpy2.mpz(67))
+        Q = EllipticCurvePoint(x=gmpy2.mpz(64), y=gmpy2.mpz(10), curve=same_curve)
+        self.assertEqual(((P + Q).x, (P + Q).y), (55, 15))
+
     def test_mul_double_and_add(self) -> None:
         curve = EllipticCurve(a=gmpy2.mpz(-2), b=gmpy2.mpz(7), p=gmpy2.mpz(19))
         P = EllipticCurvePoint(x=gmpy2.mpz(1), y=gmpy2.mpz(5), curve=curve)
@@ -180,6 +234,210 @@ class Test(unittest.TestCase):
         )
         self.assertEqual(result.is_inf, False)
 
+    def test_mul_matches_repeated_sum(self) -> None:
+        curve = EllipticCurve(a=gmpy2.mpz(13), b=gmpy2.mpz(32), p=gmpy2.mpz(67))
+        P = EllipticCurvePoint(x=gmpy2.mpz(7), y=gmpy2.mpz(8), curve=curve)
+        expected = EllipticCurvePoint(x=gmpy2.mpz(0), y=gmpy2.mpz(0), curve=curve, is_inf=True)
+        for k in range(1, 120):
+            expected = expected + P
+            for result in (P.double_and_add(k), P.ternary_mul(k)):
+                self.assertEqual(result.is_inf, expected.is_inf)
+                self.assertEqual(result.x, expected.x)
+                self.assertEqual(result.y, expected.y)
+
+    def test_mul_wnaf(self) -> None:
+        curve = EllipticCurve(a=gmpy2.mpz(13), b=gmpy2.mpz(32), p=gmpy2.mpz(67))
+        P = EllipticCurvePoint(x=gmpy2.mpz(7), y=gmpy2.mpz(8), curve=curve)
+        for width in (2, 3, 4, 5):
+            for k in range(0, 140):
+                result = P.wnaf_mul(k, width)
+                expected = P.double_and_add(k)
+                self.assertEqual((result.x, result.y, result.is_inf), (expected.x, expected.y, expected.is_inf))
+
+        curve = EllipticCurve(a=gmpy2.mpz(-2), b=gmpy2.mpz(7), p=gmpy2.mpz(19))
+        P = EllipticCurvePoint(x=gmpy2.mpz(1), y=gmpy2.mpz(5), curve=curve)
+        result = P * gmpy2.mpz(15)
+        self.assertEqual(result.x, 3)
+        self.assertEqual(result.y, 3)
+        self.assertEqual(result.is_inf, False)
+
+    def test_mul_fixed_base(self) -> None:
+        curve = EllipticCurve(a=gmpy2.mpz(13), b=gmpy2.mpz(32), p=gmpy2.mpz(67))
+        P = EllipticCurvePoint(x=gmpy2.mpz(7), y=gmpy2.mpz(8), curve=curve).precompute(window=3)
+        for k in range(0, 140):
+            result = P * k
+            expected = P.double_and_add(k)
+            self.assertEqual((result.x, result.y, result.is_inf), (expected.x, expected.y, expected.is_inf))
+        for k in range(-20, 0):  # Отрицательные скаляры не покрываются таблицей
+            result = P * k
+            expected = (-P).double_and_add(-k)
+            self.assertEqual((result.x, result.y, result.is_inf), (expected.x, expected.y, expected.is_inf))
+        for k in range(1000, 1020):  # Скаляры длиннее таблицы
+            result = P.fixed_base_mul(k)
+            expected = P.double_and_add(k)
+            self.assertEqual((result.x, result.y, result.is_inf), (expected.x, expected.y, expected.is_inf))
+
+        curve = EllipticCurve(
+            a=gmpy2.mpz("123123679126794129398123981293123821939129321391293120123123123123"),
+            b=gmpy2.mpz("1231231233284325982985987329749327432491283213812329839812932"),
+            p=gmpy2.mpz("29933500047097369067937316004196040052873624302205671175238976482131293332251605769347243889197845099882939039929103427802794111"))
+        P = EllipticCurvePoint(
+            x=gmpy2.mpz("29244634081723867984438788561326585212900803192359039624106664878889385752078911721652892386416297514704264622266882233069590590"),
+            y=gmpy2.mpz("3103463007522824575400885612643449683050049481367289110460009970054903906870734032856822506722779226673508674520703832292023951"),
+            curve=curve
+        )
+        result = P.fixed_base_mul(gmpy2.mpz("9839842989872364387643768876436980430498498435688432709843798"))
+        self.assertEqual(
+            result.x,
+            gmpy2.mpz("21235053704953676356096076306753008993950969725028202976671346849693517261122913181411988361840688070352589384751163857866960695")
+        )
+        self.assertEqual(
+            result.y,
+            gmpy2.mpz("28101692109526292993062488102117069016807791890719380932679029616771015757482614759261346977960341537861692898058486079562446642")
+        )
+
+    def test_sqrt(self) -> None:
+        # p = 3 (mod 4), p = 5 (mod 8) и p = 1 (mod 8) с разной степенью двойки в p - 1
+        for p in (19, 67, 13, 101, 17, 41, 97, 257, 7681):
+            p = gmpy2.mpz(p)
+            for x in range(0, p):
+                if gmpy2.jacobi(x, p) == -1:
+                    continue
+                root = get_sqrt(gmpy2.mpz(x), p)
+                self.assertEqual(gmpy2.powmod(root, 2, p), x)
+                self.assertEqual(root, get_sqrt(gmpy2.mpz(x), p))
+
+        for p in (gmpy2.mpz(2) ** 255 - 19, gmpy2.mpz(2) ** 224 - gmpy2.mpz(2) ** 96 + 1):
+            x = gmpy2.powmod(gmpy2.mpz(123456789), 2, p)
+            self.assertEqual(gmpy2.powmod(get_sqrt(x, p), 2, p), x)
+
+    def test_serialization(self) -> None:
+        curve = EllipticCurve(a=gmpy2.mpz(13), b=gmpy2.mpz(32), p=gmpy2.mpz(1009))
+        P = EllipticCurvePoint(x=gmpy2.mpz(3), y=gmpy2.mpz(46), curve=curve)
+        self.assertEqual(P.to_bytes(), b"\x02\x00\x03")
+        self.assertEqual(P.to_bytes(compressed=False), b"\x04\x00\x03\x00\x2e")
+        points = [P.double_and_add(k) for k in range(0, 40)]
+        for Q in points:
+            for compressed in (True, False):
+                R = EllipticCurvePoint.from_bytes(Q.to_bytes(compressed), curve)
+                self.assertEqual((R.x, R.y, R.is_inf), (Q.x, Q.y, Q.is_inf))
+        # Некорректные кодировки: не на кривой, y >= p (неканоническая запись (3, 46)), x >= p,
+        # неизвестный префикс, неверная длина, пустые данные
+        for data in (b"\x04\x00\x03\x00\x2f", b"\x04\x00\x03" + (46 + 1009).to_bytes(2, "big"),
+                     b"\x02" + (3 + 1009).to_bytes(2, "big"), b"\x05\x00\x03", b"\x02\x00\x03\x00",
+                     b"\x04\x00\x03", b"\x00\x00", b""):
+            with self.assertRaises(ValueError):
+                EllipticCurvePoint.from_bytes(data, curve)
+        # (42, 0) - точка второго порядка: четность y в префиксе обязана быть нулевой
+        T = EllipticCurvePoint(x=gmpy2.mpz(42), y=gmpy2.mpz(0), curve=curve)
+        self.assertEqual(T.to_bytes(), b"\x02\x00\x2a")
+        self.assertEqual(EllipticCurvePoint.from_bytes(b"\x02\x00\x2a", curve), T)
+        with self.assertRaises(ValueError):
+            EllipticCurvePoint.from_bytes(b"\x03\x00\x2a", curve)
+
+        for compressed in (True, False):
+            data = PointBuffer.pack(curve, points, compressed=compressed)
+            buffer = PointBuffer(bytearray(data))
+            with self.assertRaises(ValueError):
+                PointBuffer(data[:-1])
+            with self.assertRaises(ValueError):
+                PointBuffer(b"XXXX" + data[4:])
+            self.assertEqual(len(buffer), len(points))
+            self.assertEqual(buffer.curve, curve)
+            for R, Q in zip(buffer, points):
+                self.assertEqual((R.x, R.y, R.is_inf), (Q.x, Q.y, Q.is_inf))
+
+            fd, path = tempfile.mkstemp()
+            try:
+                with os.fdopen(fd, "wb") as file:
+                    file.write(data)
+                with PointBuffer.open(path, curve) as mapped:
+                    self.assertEqual((mapped[-1].x, mapped[-1].y), (points[-1].x, points[-1].y))
+                    self.assertEqual(mapped[0].is_inf, True)
+            finally:
+                os.remove(path)
+
+    def test_parallel(self) -> None:
+        curve = EllipticCurve(a=gmpy2.mpz(13), b=gmpy2.mpz(32), p=gmpy2.mpz(1009))
+        P = EllipticCurvePoint(x=gmpy2.mpz(3), y=gmpy2.mpz(46), curve=curve)
+        scalars = list(range(0, 300))
+        for workers in (1, 2):
+            results = list(curve.map_mul(P, scalars, workers=workers, chunk_size=64))
+            self.assertEqual(len(results), len(scalars))
+            for k, R in zip(scalars, results):
+                expected = P.double_and_add(k)
+                self.assertEqual((R.x, R.y, R.is_inf), (expected.x, expected.y, expected.is_inf))
+
+            points = list(curve.generate_points(100, workers=workers, chunk_size=32))
+            self.assertEqual(len(points), 100)
+            for Q in points:
+                self.assertIs(Q.curve, curve)
+                self.assertTrue(Q.double_and_add(988).is_inf)
+
+    @unittest.skipUnless(small_field.AVAILABLE, "numpy is not installed")
+    def test_small_field(self) -> None:
+        for a, b, p in ((-2, 7, 19), (13, 32, 67), (13, 32, 1009), (3, 7, 65537)):
+            engine = small_field.SmallFieldCurve(a, b, p)
+            curve = EllipticCurve(a=gmpy2.mpz(a), b=gmpy2.mpz(b), p=gmpy2.mpz(p))
+            order = engine.count_points()
+            self.assertEqual(order, int(curve.calculate_order()))
+            xs, ys = engine.points()
+            self.assertEqual(len(xs) + 1, order)
+
+        engine = small_field.SmallFieldCurve(13, 32, 1009)
+        curve = EllipticCurve(a=gmpy2.mpz(13), b=gmpy2.mpz(32), p=gmpy2.mpz(1009))
+        xs, ys = engine.points()
+        points = engine.make_points(xs, ys)
+        scalars = [7 * i + 3 for i in range(len(xs))]
+        rx, ry, rinf = engine.scalar_mul(points, scalars)
+        for i in range(0, len(xs), 37):
+            P = EllipticCurvePoint(x=gmpy2.mpz(int(xs[i])), y=gmpy2.mpz(int(ys[i])), curve=curve)
+            expected = P.double_and_add(scalars[i])
+            self.assertEqual((int(rx[i]), int(ry[i]), bool(rinf[i])), (expected.x, expected.y, expected.is_inf))
+        self.assertTrue(engine.scalar_mul(points, 988)[2].all())
+
+    def test_curve_cache(self) -> None:
+        curve = EllipticCurve(a=gmpy2.mpz(13), b=gmpy2.mpz(32), p=gmpy2.mpz(1009))
+        self.assertIs(EllipticCurve(a=gmpy2.mpz(13 + 1009), b=gmpy2.mpz(32), p=gmpy2.mpz(1009)), curve)
+        self.assertIs(pickle.loads(pickle.dumps(curve)), curve)
+        self.assertIsNot(EllipticCurve(a=gmpy2.mpz(13), b=gmpy2.mpz(32), p=gmpy2.mpz(67)), curve)
+        self.assertEqual(hash(curve), hash(EllipticCurve(a=gmpy2.mpz(13), b=gmpy2.mpz(32), p=gmpy2.mpz(1009))))
+
+        order = curve.calculate_order()
+        self.assertIs(curve.calculate_order(), order)
+        self.assertEqual(gmpy2.legendre(curve._non_residue, curve.p), -1)
+        self.assertEqual(curve._twist.calculate_order() + order, 2 * (curve.p + 1))
+
+    def test_points_and_discrete_log(self) -> None:
+        curve = EllipticCurve(a=gmpy2.mpz(13), b=gmpy2.mpz(32), p=gmpy2.mpz(1009))
+        points = list(curve.points())
+        self.assertEqual(len(points), 988)
+        self.assertTrue(points[0].is_inf)
+        self.assertEqual(len({(P.x, P.y) for P in points[1:]}), 987)
+        self.assertEqual(points[1:], sorted(points[1:], key=lambda P: (P.x, P.y)))
+
+        for P in points[1:40]:
+            n = P.order()
+            self.assertEqual(988 % n, 0)
+            self.assertTrue(P.ternary_mul(n).is_inf)
+            for q in (2, 13, 19):
+                if n % q == 0:
+                    self.assertFalse(P.ternary_mul(n // q).is_inf)
+
+        P = EllipticCurvePoint(x=gmpy2.mpz(3), y=gmpy2.mpz(46), curve=curve)
+        state = gmpy2.random_state(13)
+        for _ in range(20):
+            k = gmpy2.mpz_random(state, P.order())
+            self.assertEqual(P.discrete_log(P * k), k)
+
+        q1, q2 = gmpy2.next_prime(gmpy2.mpz(2) ** 30), gmpy2.next_prime(gmpy2.mpz(3) ** 20)
+        self.assertEqual(_factorize(q1 ** 2 * q2 * 4), {2: 2, q1: 2, q2: 1})
+
+        n = P.order()
+        gamma = P * (n // 19)
+        for k in range(1, 19):
+            self.assertEqual(_pollard_rho_log(gamma, gamma * k, gmpy2.mpz(19)), k)
+
     def test_order(self) -> None:
         curve = EllipticCurve(a=gmpy2.mpz(-2), b=gmpy2.mpz(7), p=gmpy2.mpz(19))
         self.assertEqual(int(curve.calculate_order()), 21)
@@ -190,6 +448,110 @@ class Test(unittest.TestCase):
         curve = EllipticCurve(a=gmpy2.mpz(13), b=gmpy2.mpz(32), p=gmpy2.mpz(1009))
         self.assertEqual(int(curve.calculate_order()), 988)
 
+        curve = EllipticCurve(a=gmpy2.mpz(3), b=gmpy2.mpz(7), p=gmpy2.next_prime(gmpy2.mpz(2) ** 40))
+        order = curve.calculate_order()
+        for _ in range(5):
+            self.assertTrue(curve.generate_point().ternary_mul(order).is_inf)
+
+
+    def test_order_schoof(self) -> None:
+        for a, b, p in ((-2, 7, 19), (13, 32, 67), (13, 32, 1009), (3, 7, 1000003)):
+            curve = EllipticCurve(a=gmpy2.mpz(a), b=gmpy2.mpz(b), p=gmpy2.mpz(p))
+            self.assertEqual(int(schoof_order(curve.a, curve.b, curve.p)), int(curve.calculate_order()))
+
+        # Для 65-битного p calculate_order идет через BSGS - сверка двух независимых путей
+        curve = EllipticCurve(a=gmpy2.mpz(3), b=gmpy2.mpz(7), p=gmpy2.next_prime(gmpy2.mpz(2) ** 64))
+        order = curve.calculate_order()
+        self.assertEqual(schoof_order(curve.a, curve.b, curve.p), order)
+        for _ in range(5):
+            self.assertTrue(curve.generate_point().ternary_mul(order).is_inf)
+
+    def test_instrumentation(self) -> None:
+        curve = EllipticCurve(a=gmpy2.mpz(13), b=gmpy2.mpz(32), p=gmpy2.mpz(1009))
+        P = EllipticCurvePoint(x=gmpy2.mpz(3), y=gmpy2.mpz(46), curve=curve)
+        with Instrumentation() as stats:
+            P.double_and_add(0b1011)
+            Q = EllipticCurvePoint(x=gmpy2.mpz(3), y=gmpy2.mpz(46), curve=curve)
+            P + Q
+        report = stats.report()
+        # 3 удвоения и 2 смешанных сложения в координатах Якоби (удвоение бесконечности и сложение с ней
+        # не считаются), одно аффинное удвоение
+        self.assertEqual(report['counts']['doublings'], 4)
+        self.assertEqual(report['counts']['additions'], 2)
+        # 10 на удвоение Якоби, 11 на смешанное сложение, по 4 на аффинное удвоение и переход к аффинным
+        self.assertEqual(report['counts']['multiplications'], 3 * 10 + 2 * 11 + 4 + 4)
+        self.assertEqual(report['counts']['inversions'], 2)
+        self.assertEqual(report['counts']['validations'], 1)
+        [site] = report['sites']
+        self.assertEqual(site['method'], 'EllipticCurvePoint.double_and_add')
+        self.assertEqual((site['file'], site['calls']), (__file__, 1))
+        self.assertEqual(site['counts']['doublings'], 3)
+
+        # P + (-P) - не сложение и не удвоение, P + P в смешанном сложении - одно удвоение
+        jacobian = (P.x, P.y, gmpy2.mpz(1))
+        with Instrumentation() as stats:
+            self.assertEqual(_jacobian_add_affine(jacobian, P.x, (-P).y, curve.a, curve.p)[2], 0)
+            _jacobian_add_affine(jacobian, P.x, P.y, curve.a, curve.p)
+        self.assertEqual(stats.report()['counts'], {'doublings': 1, 'multiplications': 2 * 4 + 10})
+
+        with Instrumentation() as outer:
+            with Instrumentation() as inner:
+                P.ternary_mul(5)
+            P.ternary_mul(5)
+        self.assertEqual(inner.report()['sites'][0]['calls'], 1)
+        self.assertEqual(outer.report()['sites'][0]['calls'], 1)
+        P.ternary_mul(5)
+        self.assertEqual(outer.report()['sites'][0]['calls'], 1)
+
+    def test_async_service(self) -> None:
+        curve = EllipticCurve(a=gmpy2.mpz(13), b=gmpy2.mpz(32), p=gmpy2.mpz(1009))
+        P = EllipticCurvePoint(x=gmpy2.mpz(3), y=gmpy2.mpz(46), curve=curve)
+
+        async def run():
+            async with CurveService(max_batch=16, max_pending=8) as service:
+                scalars = list(range(-5, 60))
+                results = await asyncio.gather(*(service.mul(P, k) for k in scalars))
+                for k, R in zip(scalars, results):
+                    self.assertEqual(R, P.wnaf_mul(k))
+
+                orders = await asyncio.gather(*(service.order(curve) for _ in range(3)))
+                self.assertEqual([int(order) for order in orders], [988] * 3)
+                points = await asyncio.gather(*(service.generate_point(curve) for _ in range(20)))
+                for Q in points:
+                    self.assertTrue(Q.ternary_mul(988).is_inf)
+
+                task = asyncio.ensure_future(service.mul(P, 7))
+                await asyncio.sleep(0)
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+                self.assertEqual(await service.mul(P, 7), P.wnaf_mul(7))
+                self.assertEqual(service._slots._value, 8)
+
+        asyncio.run(run())
+
+        # Пакеты по 4 точки на 128-битной кривой: повторы точек означали бы повтор зерна между пакетами
+        big = EllipticCurve(a=gmpy2.mpz(3), b=gmpy2.mpz(7), p=gmpy2.next_prime(gmpy2.mpz(2) ** 127))
+        points = []
+        for _ in range(50):
+            points += async_service._run_generate(big, [None] * 4)
+        self.assertEqual(len({(Q.x, Q.y) for Q in points}), 200)
+
+    def test_benchmark(self) -> None:
+        current = benchmark.run(bits=(16,), order_bits=(16,), min_time=0, min_repeats=3)
+        self.assertEqual(set(current['results']), {
+            f'{name}/16' for name in ('add', 'double', 'double_and_add', 'ternary_mul', 'get_sqrt',
+                                      'generate_point', 'calculate_order')})
+        for result in current['results'].values():
+            self.assertGreater(result['ops_per_sec'], 0)
+            self.assertLessEqual(result['latency']['p50'], result['latency']['p99'])
+        self.assertEqual(benchmark.compare(current, current, 0.2), [])
+
+        baseline = {'results': {key: dict(result, ops_per_sec=result['ops_per_sec'] * 2)
+                                for key, result in current['results'].items()}}
+        self.assertEqual(len(benchmark.compare(current, baseline, 0.2)), len(current['results']))
+        self.assertEqual(benchmark.compare(current, baseline, 0.6), [])
+
 
 def main():
     # Noting to do :(
@@ -0,0 +1,336 @@
+"""
+Подсчет числа точек кривой y^2 = x^3 + ax + b над F_p алгоритмом Шуфа.
+Многочлены хранятся списками коэффициентов по возрастанию степени,
+умножение выполняется подстановкой Кронекера: коэффициенты упаковываются в одно число gmpy2.mpz
+"""
+import gmpy2
+
+
+def _trim(a: list) -> list:
+    while a and a[-1] == 0:
+        a.pop()
+    return a
+
+
+def _pack(a: list, slot: int) -> gmpy2.mpz:
+    return gmpy2.mpz.from_bytes(b''.join([c.to_bytes(slot, 'little') for c in a]), 'little')
+
+
+def _unpack(c: gmpy2.mpz, slot: int, length: int, p: int = None) -> list:
+    """
+    Младшие length ячеек упакованного произведения, при заданном p - приведенные по модулю p
+    """
+    data = memoryview(gmpy2.f_mod_2exp(c, 8 * slot * length).to_bytes(length * slot, 'little'))
+    if p is None:
+        return [int.from_bytes(data[i:i + slot], 'little') for i in range(0, length * slot, slot)]
+    return [int.from_bytes(data[i:i + slot], 'little') % p for i in range(0, length * slot, slot)]
+
+
+def _slot_size(p: int, terms: int) -> int:
+    # В каждой ячейке помещается сумма terms произведений коэффициентов
+    return (2 * p.bit_length() + terms.bit_length() + 7) // 8
+
+
+def _poly_mul(a: list, b: list, p: int) -> list:
+    if not a or not b:
+        return []
+    if len(a) < 8 or len(b) < 8:  # Для коротких многочленов упаковка дороже умножения в столбик
+        result = [0] * (len(a) + len(b) - 1)
+        for i, ai in enumerate(a):
+            if ai:
+                for j, bj in enumerate(b):
+                    result[i + j] += ai * bj
+        return _trim([c % p for c in result])
+    slot = _slot_size(p, min(len(a), len(b)))
+    return _trim(_unpack(_pack(a, slot) * _pack(b, slot), slot, len(a) + len(b) - 1, p))
+
+
+def _poly_sub(a: list, b: list, p: int) -> list:
+    if len(a) < len(b):
+        a = a + [0] * (len(b) - len(a))
+    return _trim([(ai - bi) % p for ai, bi in zip(a, b)] + a[len(b):])
+
+
+def _poly_scale(a: list, c: int, p: int) -> list:
+    return _trim([ai * c % p for ai in a])
+
+
+def _poly_monic(a: list, p: int) -> list:
+    return _poly_scale(a, pow(a[-1], -1, p), p)
+
+
+def _poly_gcd(a: list, b: list, p: int) -> list:
+    """
+    Нормированный НОД многочленов алгоритмом Евклида
+    """
+    a, b = _trim(list(a)), _trim(list(b))
+    while b:
+        b = _poly_monic(b, p)
+        n = len(b) - 1
+        while len(a) > n:
+            c = a[-1]
+            k = len(a) - 1 - n
+            a[k:] = [(ai - c * bi) % p for ai, bi in zip(a[k:], b)]
+            _trim(a)
+        a, b = b, a
+    return _poly_monic(a, p) if a else a
+
+
+class _QuotientRing:
+    """
+    Кольцо F_p[x] / (h) для нормированного h, приведение по модулю h - методом Барретта
+    """
+    def __init__(self, h: list, p: int):
+        self.p = p
+        self.h = h
+        self.n = len(h) - 1
+        # Обратный ряд к развернутому h по модулю x^(n-1), строится итерациями Ньютона
+        rev = h[::-1]
+        k = max(self.n - 1, 1)
+        inv = [1]
+        size = 1
+        while size < k:
+            size = min(2 * size, k)
+            e = _poly_sub([2], _poly_mul(rev[:size], inv, p)[:size], p)
+            inv = _trim(_poly_mul(inv, e, p)[:size])
+        self.h_rev_inv = inv
+        # Все операнды имеют степень меньше n, поэтому ширина ячейки общая для всех произведений в кольце
+        self.slot = _slot_size(p, self.n + 1)
+        self.h_packed = _pack(h, self.slot)
+        self.h_rev_inv_packed = _pack(inv, self.slot)
+
+    def reduce(self, c: list) -> list:
+        n, p = self.n, self.p
+        if len(c) <= n:
+            return c
+        return self._reduce_unpacked(c)
+
+    def _reduce_unpacked(self, c: list) -> list:
+        n, p, slot = self.n, self.p, self.slot
+        m = len(c) - 1 - n
+        # Младшие m + 1 ячеек произведения с полным обратным рядом совпадают с усеченным
+        top = [ci % p for ci in c[:n - 1:-1]]
+        q = _unpack(_pack(top, slot) * self.h_rev_inv_packed, slot, m + 1, p)[::-1]
+        # Младшие коэффициенты c и q * h приводятся по модулю p один раз, уже после вычитания
+        qh = _unpack(_pack(q, slot) * self.h_packed, slot, n)
+        return _trim([(ci - di) % p for ci, di in zip(c, qh)])
+
+    def mul(self, a: list, b: list) -> list:
+        if len(a) < 8 or len(b) < 8:
+            return self.reduce(_poly_mul(a, b, self.p))
+        A = _pack(a, self.slot)
+        B = A if a is b else _pack(b, self.slot)
+        length = len(a) + len(b) - 1
+        if length <= self.n:
+            return _trim(_unpack(A * B, self.slot, length, self.p))
+        return self._reduce_unpacked(_unpack(A * B, self.slot, length))
+
+    def pow(self, a: list, e: int) -> list:
+        # Возведение в степень скользящим окном ширины 4
+        table = [a]
+        a2 = self.mul(a, a)
+        for _ in range(7):
+            table.append(self.mul(table[-1], a2))
+        bits = bin(e)[2:]
+        result = [1]
+        i = 0
+        while i < len(bits):
+            if bits[i] == '0':
+                result = self.mul(result, result)
+                i += 1
+                continue
+            j = min(i + 4, len(bits))
+            while bits[j - 1] == '0':
+                j -= 1
+            for _ in range(j - i):
+                result = self.mul(result, result)
+            result = self.mul(result, table[int(bits[i:j], 2) >> 1])
+            i = j
+        return result
+
+    def pow_x(self, e: int) -> list:
+        # Умножение на x - сдвиг, поэтому x^e считается только возведениями в квадрат
+        result = [1]
+        for bit in bin(e)[2:]:
+            result = self.mul(result, result)
+            if bit == '1':
+                result = self.reduce([0] + result)
+        return result
+
+
+def _division_polynomials(a: int, b: int, p: int, count: int) -> list:
+    """
+    Многочлены деления f_0..f_count: f_n = psi_n для нечетных n и f_n = psi_n / y для четных
+    """
+    F2 = _poly_mul([b, a, 0, 1], [b, a, 0, 1], p)
+    f = [[], [1], [2],
+         _trim([(-a * a) % p, 12 * b % p, 6 * a % p, 0, 3]),
+         _trim([(-4 * a ** 3 - 32 * b * b) % p, (-16 * a * b) % p, (-20 * a * a) % p, 80 * b % p, 20 * a % p, 0, 4])]
+    inv2 = pow(2, -1, p)
+    for n in range(5, count + 1):
+        m = n // 2
+        if n % 2:
+            left = _poly_mul(f[m + 2], _poly_mul(f[m], _poly_mul(f[m], f[m], p), p), p)
+            right = _poly_mul(f[m - 1], _poly_mul(f[m + 1], _poly_mul(f[m + 1], f[m + 1], p), p), p)
+            if m % 2 == 0:
+                left = _poly_mul(left, F2, p)
+            else:
+                right = _poly_mul(right, F2, p)
+            f.append(_poly_sub(left, right, p))
+        else:
+            inner = _poly_sub(
+                _poly_mul(f[m + 2], _poly_mul(f[m - 1], f[m - 1], p), p),
+                _poly_mul(f[m - 2], _poly_mul(f[m + 1], f[m + 1], p), p), p)
+            f.append(_poly_scale(_poly_mul(f[m], inner, p), inv2, p))
+    return f
+
+
+class _TorsionArithmetic:
+    """
+    Точки из E[l] в координатах Якоби над кольцом F_p[x] / (h): (X, Y, Z) соответствует точке
+    (X / Z^2, y * Y / Z^3), множитель y вынесен и сокращается с помощью y^2 = F(x)
+    """
+    def __init__(self, ring: _QuotientRing, a: int, F: list, f: list):
+        self.ring = ring
+        self.a = a
+        self.F = ring.reduce(F)
+        self.f = [ring.reduce(g) for g in f]
+
+    def _f(self, n: int) -> list:
+        if n < 0:
+            return _poly_scale(self.f[-n], -1, self.ring.p)
+        return self.f[n]
+
+    def multiple(self, k: int) -> tuple:
+        """
+        Точка [k](x, y) через многочлены деления
+        """
+        ring, p = self.ring, self.ring.p
+        fk = self._f(k)
+        D = _poly_scale(_poly_sub(
+            ring.mul(self._f(k + 2), ring.mul(self._f(k - 1), self._f(k - 1))),
+            ring.mul(self._f(k - 2), ring.mul(self._f(k + 1), self._f(k + 1))), p), pow(4, -1, p), p)
+        fk2 = ring.mul(fk, fk)
+        neighbours = ring.mul(self._f(k - 1), self._f(k + 1))
+        if k % 2:
+            X = _poly_sub(ring.mul([0, 1], fk2), ring.mul(self.F, neighbours), p)
+            return X, D, fk
+        Z = ring.mul(self.F, fk)
+        X = ring.mul(self.F, _poly_sub(ring.mul([0, 1], ring.mul(self.F, fk2)), neighbours, p))
+        return X, ring.mul(self.F, D), Z
+
+    def add(self, P: tuple, Q: tuple) -> tuple:
+        ring, p = self.ring, self.ring.p
+        X1, Y1, Z1 = P
+        X2, Y2, Z2 = Q
+        Z1Z1 = ring.mul(Z1, Z1)
+        Z2Z2 = ring.mul(Z2, Z2)
+        U1 = ring.mul(X1, Z2Z2)
+        U2 = ring.mul(X2, Z1Z1)
+        S1 = ring.mul(Y1, ring.mul(Z2, Z2Z2))
+        S2 = ring.mul(Y2, ring.mul(Z1, Z1Z1))
+        H = _poly_sub(U2, U1, p)
+        r = _poly_sub(S2, S1, p)
+        HH = ring.mul(H, H)
+        HHH = ring.mul(H, HH)
+        V = ring.mul(U1, HH)
+        X3 = _poly_sub(_poly_sub(ring.mul(self.F, ring.mul(r, r)), HHH, p), _poly_scale(V, 2, p), p)
+        Y3 = _poly_sub(ring.mul(r, _poly_sub(V, X3, p)), ring.mul(S1, HHH), p)
+        Z3 = ring.mul(ring.mul(Z1, Z2), H)
+        return X3, Y3, Z3
+
+    def double(self, P: tuple) -> tuple:
+        ring, p = self.ring, self.ring.p
+        X, Y, Z = P
+        YY = ring.mul(self.F, ring.mul(Y, Y))
+        S = _poly_scale(ring.mul(X, YY), 4, p)
+        ZZ = ring.mul(Z, Z)
+        M = _poly_sub(_poly_scale(ring.mul(X, X), 3, p), _poly_scale(ring.mul(ZZ, ZZ), -self.a, p), p)
+        X3 = _poly_sub(ring.mul(M, M), _poly_scale(S, 2, p), p)
+        Y3 = _poly_sub(ring.mul(M, _poly_sub(S, X3, p)), _poly_scale(ring.mul(YY, YY), 8, p), p)
+        # Настоящая координата Z3 = 2yYZ, домножением на F множитель y переносится в Y3
+        return ring.mul(self.F, X3), ring.mul(self.F, Y3), _poly_scale(ring.mul(self.F, ring.mul(Y, Z)), 2, p)
+
+    def same_x(self, P: tuple, Q: tuple) -> bool:
+        ring = self.ring
+        return (ring.mul(P[0], ring.mul(Q[2], Q[2])) ==
+                ring.mul(Q[0], ring.mul(P[2], P[2])))
+
+    def same_y(self, P: tuple, Q: tuple) -> bool:
+        ring = self.ring
+        return (ring.mul(P[1], ring.mul(Q[2], ring.mul(Q[2], Q[2]))) ==
+                ring.mul(Q[1], ring.mul(P[2], ring.mul(P[2], P[2]))))
+
+
+def _trace_mod_2(a: int, b: int, p: int) -> int:
+    # След четен тогда и только тогда, когда на кривой есть точка второго порядка
+    F = [b, a, 0, 1]
+    ring = _QuotientRing(F, p)
+    g = _poly_gcd(_poly_sub(ring.pow_x(p), [0, 1], p), F, p)
+    return 0 if len(g) > 1 else 1
+
+
+def _trace_mod_l(a: int, b: int, p: int, l: int, f: list) -> int:
+    F = [b, a, 0, 1]
+    ring = _QuotientRing(_poly_monic(f[l], p), p)
+    E = _TorsionArithmetic(ring, a, F, f[:l + 2])
+
+    # Эндоморфизм Фробениуса pi(x, y) = (x^p, y^p) = (x^p, y * F^((p - 1) / 2)) и его квадрат
+    X1 = ring.pow_x(p)
+    Y1 = ring.pow(E.F, (p - 1) // 2)
+    X2 = ring.pow(X1, p)
+    Y2 = ring.mul(ring.pow(Y1, p), Y1)
+    pi = (X1, Y1, [1])
+    pi2 = (X2, Y2, [1])
+
+    q = p % l
+    Pq = E.multiple(q)
+    Xq, Yq, Zq = Pq
+    if len(_poly_gcd(_poly_sub(Xq, ring.mul(X2, ring.mul(Zq, Zq)), p), ring.h, p)) > 1:
+        # pi^2 P = +-qP для некоторой точки P из E[l]
+        if gmpy2.legendre(q, l) != 1:
+            return 0
+        w = next(w for w in range(1, l) if w * w % l == q)
+        Xw, Yw, Zw = E.multiple(w)
+        ZwZw = ring.mul(Zw, Zw)
+        if len(_poly_gcd(_poly_sub(ring.mul(X1, ZwZw), Xw, p), ring.h, p)) == 1:
+            return 0
+        if len(_poly_gcd(_poly_sub(ring.mul(Y1, ring.mul(Zw, ZwZw)), Yw, p), ring.h, p)) > 1:
+            return 2 * w % l
+        return -2 * w % l
+
+    # pi^2 + q - обычное сложение; подбирается tau, для которого pi^2 + q == tau * pi
+    Q = E.add(pi2, Pq)
+    R = pi
+    for tau in range(1, (l - 1) // 2 + 1):
+        if E.same_x(Q, R):
+            return tau if E.same_y(Q, R) else l - tau
+        R = E.double(R) if tau == 1 else E.add(R, pi)
+    raise ArithmeticError(f"trace modulo {l} not found")
+
+
+def schoof_order(a: gmpy2.mpz, b: gmpy2.mpz, p: gmpy2.mpz) -> gmpy2.mpz:
+    """
+    Порядок группы точек p + 1 - t: след t восстанавливается по китайской теореме об остатках
+    из t mod l для простых l, произведение которых больше 4 * sqrt(p)
+    """
+    a, b, p = int(a) % int(p), int(b) % int(p), int(p)
+    primes = []
+    modulus = 2
+    l = 2
+    while modulus * modulus <= 16 * p:
+        l = int(gmpy2.next_prime(l))
+        if l == p:
+            continue
+        primes.append(l)
+        modulus *= l
+    f = _division_polynomials(a, b, p, max(primes, default=3) + 2)
+
+    t, modulus = _trace_mod_2(a, b, p), 2
+    for l in primes:
+        t_l = _trace_mod_l(a, b, p, l, f)
+        t += modulus * ((t_l - t) * pow(modulus, -1, l) % l)
+        modulus *= l
+    if 2 * t > modulus:
+        t -= modulus
+    return gmpy2.mpz(p + 1 - t)
@@ -0,0 +1,155 @@
+"""
+Векторный движок для кривых над небольшими полями на массивах NumPy.
+Элементы поля хранятся в uint64, поэтому p < 2^32: произведение двух вычетов помещается в машинное слово.
+Точки - тройки массивов (x, y, inf), где inf - признак бесконечно удаленной точки
+"""
+try:
+    import numpy
+except ImportError:  # Движок необязателен: без NumPy используются обычные пути через gmpy2
+    numpy = None
+
+AVAILABLE = numpy is not None
+MAX_P = 1 << 32
+_BLOCK = 1 << 20  # Число x, обрабатываемых за один проход при подсчете точек
+
+
+class SmallFieldCurve:
+    def __init__(self, a: int, b: int, p: int):
+        assert AVAILABLE
+        assert 3 < p < MAX_P
+        self.p = int(p)
+        self.a = int(a) % self.p
+        self.b = int(b) % self.p
+        assert (4 * self.a ** 3 + 27 * self.b ** 2) % self.p != 0
+
+    def _array(self, values) -> 'numpy.ndarray':
+        return numpy.asarray(values, dtype=numpy.uint64) % numpy.uint64(self.p)
+
+    def _mul(self, u, v):
+        return u * v % numpy.uint64(self.p)
+
+    def _add(self, u, v):
+        return (u + v) % numpy.uint64(self.p)
+
+    def _sub(self, u, v):
+        return (u + numpy.uint64(self.p) - v) % numpy.uint64(self.p)
+
+    def _pow(self, base, e: int):
+        result = numpy.ones_like(base)
+        while e:
+            if e & 1:
+                result = self._mul(result, base)
+            base = self._mul(base, base)
+            e >>= 1
+        return result
+
+    def _inverse(self, u):
+        return self._pow(u, self.p - 2)
+
+    def rhs(self, xs):
+        """
+        Значения x^3 + ax + b для массива x
+        """
+        xs = self._array(xs)
+        return self._add(self._mul(xs, self._add(self._mul(xs, xs), numpy.uint64(self.a))), numpy.uint64(self.b))
+
+    def legendre_symbols(self, xs) -> 'numpy.ndarray':
+        """
+        Символы Лежандра (x^3 + ax + b / p) по критерию Эйлера, массив int8 из -1, 0, 1
+        """
+        r = self._pow(self.rhs(xs), (self.p - 1) // 2)
+        return (r == 1).astype(numpy.int8) - (r == self.p - 1).astype(numpy.int8)
+
+    def count_points(self) -> int:
+        """
+        Порядок группы p + 1 + Sum(legendre(x^3 + ax + b, p)) по всем x, блоками по _BLOCK значений
+        """
+        total = 0
+        for start in range(0, self.p, _BLOCK):
+            xs = numpy.arange(start, min(start + _BLOCK, self.p), dtype=numpy.uint64)
+            total += int(self.legendre_symbols(xs).sum(dtype=numpy.int64))
+        return self.p + 1 + total
+
+    def points(self) -> tuple:
+        """
+        Все конечные точки кривой (x, y), упорядоченные по x, затем по y
+        """
+        ys = numpy.arange(self.p, dtype=numpy.uint64)
+        squares = self._mul(ys, ys)
+        order = numpy.argsort(squares, kind='stable')
+        sorted_squares = squares[order]
+        xs = numpy.arange(self.p, dtype=numpy.uint64)
+        values = self.rhs(xs)
+        idx = numpy.minimum(numpy.searchsorted(sorted_squares, values), self.p - 1)
+        found = sorted_squares[idx] == values
+        xs, roots = xs[found], ys[order[idx[found]]]
+        # Второй корень p - y, у точек с y == 0 он совпадает с первым
+        other = self._sub(numpy.zeros_like(roots), roots)
+        has_pair = roots != 0
+        all_x = numpy.concatenate([xs, xs[has_pair]])
+        all_y = numpy.concatenate([numpy.minimum(roots, other), numpy.maximum(roots, other)[has_pair]])
+        sort = numpy.lexsort((all_y, all_x))
+        return all_x[sort], all_y[sort]
+
+    def infinity(self, count: int) -> tuple:
+        zeros = numpy.zeros(count, dtype=numpy.uint64)
+        return zeros, zeros.copy(), numpy.ones(count, dtype=bool)
+
+    def make_points(self, xs, ys) -> tuple:
+        """
+        Массив конечных точек с проверкой уравнения кривой
+        """
+        xs, ys = self._array(xs), self._array(ys)
+        assert numpy.array_equal(self._mul(ys, ys), self.rhs(xs))
+        return xs, ys, numpy.zeros(xs.shape, dtype=bool)
+
+    def add(self, P: tuple, Q: tuple) -> tuple:
+        """
+        Поэлементная сумма массивов точек: все знаменатели обращаются одним векторным возведением в степень
+        """
+        x1, y1, inf1 = P
+        x2, y2, inf2 = Q
+        same_x = x1 == x2
+        doubling = same_x & (y1 == y2) & (y1 != 0)
+        num = numpy.where(doubling, self._add(self._mul(numpy.uint64(3), self._mul(x1, x1)), numpy.uint64(self.a)),
+                          self._sub(y2, y1))
+        den = numpy.where(doubling, self._add(y1, y1), self._sub(x2, x1))
+        den = numpy.where(den == 0, numpy.uint64(1), den)
+        coeff = self._mul(num, self._inverse(den))
+        x3 = self._sub(self._sub(self._mul(coeff, coeff), x1), x2)
+        y3 = self._sub(self._mul(coeff, self._sub(x1, x3)), y1)
+        inf3 = same_x & ~doubling
+        # Слагаемые в бесконечности
+        x3 = numpy.where(inf1, x2, numpy.where(inf2, x1, x3))
+        y3 = numpy.where(inf1, y2, numpy.where(inf2, y1, y3))
+        inf3 = numpy.where(inf1, inf2, numpy.where(inf2, inf1, inf3))
+        x3 = numpy.where(inf3, numpy.uint64(0), x3)
+        y3 = numpy.where(inf3, numpy.uint64(0), y3)
+        return x3, y3, inf3
+
+    def double(self, P: tuple) -> tuple:
+        return self.add(P, P)
+
+    def neg(self, P: tuple) -> tuple:
+        x, y, inf = P
+        return x, self._sub(numpy.zeros_like(y), y), inf
+
+    def scalar_mul(self, P: tuple, scalars) -> tuple:
+        """
+        k * P поэлементно: scalars - одно неотрицательное целое для всех точек или массив скаляров < 2^64
+        """
+        result = self.infinity(len(P[0]))
+        if isinstance(scalars, int):
+            bits = scalars.bit_length()
+            masks = [numpy.full(len(P[0]), (scalars >> i) & 1 == 1) for i in range(bits)]
+        else:
+            scalars = numpy.asarray(scalars, dtype=numpy.uint64)
+            bits = int(scalars.max()).bit_length() if scalars.size else 0
+            masks = [(scalars >> numpy.uint64(i)) & numpy.uint64(1) == 1 for i in range(bits)]
+        T = P
+        for i, mask in enumerate(masks):
+            S = self.add(result, T)
+            result = tuple(numpy.where(mask, s, r) for s, r in zip(S, result))
+            if i + 1 < bits:
+                T = self.double(T)
+        return result